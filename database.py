@@ -1,7 +1,7 @@
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timezone
+import re
 
 load_dotenv()
 
@@ -11,27 +11,100 @@ DB_NAME = os.getenv("DB_NAME", "candyman")
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
 user_details_collection = db["user_details"]
+gpu_jobs_collection = db["gpu_jobs"]
+counters_collection = db["counters"]
 
-def save_user_details(data: dict):
-    try:
-        existing = user_details_collection.find_one({"job_id": data["job_id"]}) or {}
+# discount code -> (order_id prefix, number the first order follows when no orders exist)
+ORDER_ID_SEQUENCES = {
+    "TEST": ("TEST#", 0),
+    "COLLAB": ("COLLAB#", 0),
+    "DEFAULT": ("#", 1199),
+}
 
-        if "created_at" not in existing:
-            data["created_at"] = datetime.now(timezone.utc)
+USER_DETAILS_INDEXES = [
+    ([("job_id", ASCENDING)], {"name": "job_id_unique", "unique": True}),
+    ([("order_id", ASCENDING)], {"name": "order_id", "sparse": True}),
+    ([("paypal_order_id", ASCENDING)], {"name": "paypal_order_id", "sparse": True}),
+    # admin order lists and status dashboards
+    ([("paid", ASCENDING), ("approved", ASCENDING), ("created_at", DESCENDING)],
+     {"name": "paid_approved_created"}),
+    ([("workflow_status", ASCENDING), ("updated_at", DESCENDING)],
+     {"name": "workflow_status_updated"}),
+    ([("email", ASCENDING), ("created_at", DESCENDING)], {"name": "email_created"}),
+]
 
-        merged = {**existing, **data}
-        merged["updated_at"] = datetime.now(timezone.utc)
+# Hot lookups that must never fall back to a full collection scan
+HOT_QUERIES = {
+    "job_id": {"job_id": "__index_probe__"},
+    "order_id": {"order_id": "__index_probe__"},
+    "order_id_regex": {"order_id": {"$regex": r"^#(\d+)$"}},
+    "paypal_order_id": {"paypal_order_id": "__index_probe__"},
+}
 
-        user_details_collection.update_one(
-            {"job_id": merged["job_id"]},
-            {"$set": merged},
-            upsert=True
-        )
+def _highest_order_number(prefix: str, default: int) -> int:
+    pipeline = [
+        {"$match": {"order_id": {"$regex": f"^{re.escape(prefix)}(\\d+)$"}}},
+        {"$project": {
+            "order_num": {
+                "$toInt": {"$arrayElemAt": [{"$split": ["$order_id", "#"]}, 1]}
+            }
+        }},
+        {"$sort": {"order_num": -1}},
+        {"$limit": 1}
+    ]
+    result = list(user_details_collection.aggregate(pipeline))
+    return result[0]["order_num"] if result else default
 
-        print(f"✅ Merged + saved user details for job_id: {merged['job_id']}")
-    except Exception as e:
-        print(f"❌ Failed to save user details: {e}")
-        raise ValueError("Failed to save user details to the database.")
+def next_order_id(discount_code: str = "") -> str:
+    prefix, default = ORDER_ID_SEQUENCES.get(
+        (discount_code or "").upper(), ORDER_ID_SEQUENCES["DEFAULT"])
+    counter_id = f"order_id:{prefix}"
+
+    counter = counters_collection.find_one_and_update(
+        {"_id": counter_id}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER)
+    if counter is None:
+        # First use of this prefix: seed from the existing orders once. $max keeps
+        # concurrent seeders from moving the sequence backwards.
+        counters_collection.update_one(
+            {"_id": counter_id},
+            {"$max": {"seq": _highest_order_number(prefix, default)}},
+            upsert=True)
+        print(f"🔢 Seeded order sequence {counter_id}")
+        counter = counters_collection.find_one_and_update(
+            {"_id": counter_id}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER)
+
+    return f"{prefix}{counter['seq']}"
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+def verify_query_plans():
+    collscans = []
+    for name, query in HOT_QUERIES.items():
+        explain = user_details_collection.find(query).explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            collscans.append(name)
+
+    if collscans:
+        raise RuntimeError(f"user_details queries fell back to COLLSCAN: {', '.join(collscans)}")
+    print(f"✅ Verified index plans for {len(HOT_QUERIES)} hot user_details queries")
+
+def ensure_indexes():
+    for keys, options in USER_DETAILS_INDEXES:
+        try:
+            user_details_collection.create_index(keys, **options)
+        except Exception as e:
+            # e.g. duplicate job_ids blocking the unique index: stop the deploy, don't limp on
+            print(f"❌ Failed to create index {options['name']} on user_details: {e}")
+            raise
+    print(f"✅ Ensured {len(USER_DETAILS_INDEXES)} user_details indexes")
+    verify_query_plans()
 
 def check_db_connection():
     try:
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COMFYUI_MAX_CONCURRENCY = int(os.getenv("COMFYUI_MAX_CONCURRENCY", "16"))
+COMFYUI_CONNECT_TIMEOUT = float(os.getenv("COMFYUI_CONNECT_TIMEOUT", "5"))
+COMFYUI_QUEUE_TIMEOUT = float(os.getenv("COMFYUI_QUEUE_TIMEOUT", "30"))
+COMFYUI_HISTORY_TIMEOUT = float(os.getenv("COMFYUI_HISTORY_TIMEOUT", "30"))
+COMFYUI_IMAGE_TIMEOUT = float(os.getenv("COMFYUI_IMAGE_TIMEOUT", "120"))
+
+
+class ComfyUIError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        # False when the node answered but rejected the request (e.g. an invalid prompt)
+        self.retryable = retryable
+
+
+# Pooled, keep-alive HTTP client for one ComfyUI server
+class ComfyUIClient:
+    def __init__(self, server_address: str, max_concurrency: int = COMFYUI_MAX_CONCURRENCY):
+        self.server_address = server_address
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=f"http://{server_address}",
+            timeout=httpx.Timeout(COMFYUI_HISTORY_TIMEOUT, connect=COMFYUI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=60,
+            ),
+        )
+
+    async def _request(self, method: str, url: str, timeout: float, **kwargs) -> httpx.Response:
+        async with self._semaphore:
+            try:
+                response = await self._client.request(
+                    method, url,
+                    timeout=httpx.Timeout(timeout, connect=COMFYUI_CONNECT_TIMEOUT),
+                    **kwargs)
+                response.raise_for_status()
+                return response
+            except httpx.HTTPStatusError as e:
+                raise ComfyUIError(
+                    f"{method} {url} on {self.server_address} failed: {e}",
+                    retryable=e.response.status_code >= 500) from e
+            except httpx.HTTPError as e:
+                raise ComfyUIError(f"{method} {url} on {self.server_address} failed: {e}") from e
+
+    async def queue_prompt(self, prompt: dict, client_id: str) -> dict:
+        response = await self._request(
+            "POST", "/prompt", COMFYUI_QUEUE_TIMEOUT,
+            json={"prompt": prompt, "client_id": client_id})
+        return response.json()
+
+    async def get_history(self, prompt_id: str) -> dict:
+        response = await self._request("GET", f"/history/{prompt_id}", COMFYUI_HISTORY_TIMEOUT)
+        return response.json()
+
+    async def get_image(self, filename: str, subfolder: str, folder_type: str) -> bytes:
+        response = await self._request(
+            "GET", "/view", COMFYUI_IMAGE_TIMEOUT,
+            params={"filename": filename, "subfolder": subfolder, "type": folder_type})
+        return response.content
+
+    async def get_queue(self) -> dict:
+        response = await self._request("GET", "/queue", COMFYUI_CONNECT_TIMEOUT)
+        return response.json()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# httpx and asyncio primitives are bound to the loop that first uses them
+_clients: dict[tuple[int, str], ComfyUIClient] = {}
+
+
+def get_comfy_client(server_address: str) -> ComfyUIClient:
+    key = (id(asyncio.get_running_loop()), server_address)
+    client = _clients.get(key)
+    if client is None:
+        client = ComfyUIClient(server_address)
+        _clients[key] = client
+    return client
+
+
+async def close_comfy_clients():
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _clients if k[0] == loop_id]:
+        await _clients.pop(key).aclose()
+
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from helper.comfy_client import close_comfy_clients, get_comfy_client
+from helper.comfy_ws import get_existing_ws_session
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COMFYUI_MAX_INFLIGHT_PER_NODE = int(os.getenv("COMFYUI_MAX_INFLIGHT_PER_NODE", "2"))
+COMFYUI_HEALTH_INTERVAL = float(os.getenv("COMFYUI_HEALTH_INTERVAL", "10"))
+COMFYUI_FAILURE_THRESHOLD = int(os.getenv("COMFYUI_FAILURE_THRESHOLD", "2"))
+
+
+def configured_comfy_servers() -> list[str]:
+    # COMFYUI_SERVERS="gpu1:8188,gpu2:8188"; falls back to the single SERVER_ADDRESS
+    raw = os.getenv("COMFYUI_SERVERS") or os.getenv("SERVER_ADDRESS") or ""
+    return [address.strip() for address in raw.split(",") if address.strip()]
+
+
+class ComfyNode:
+    def __init__(self, address: str, max_inflight: int):
+        self.address = address
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.queue_depth = 0
+        self.healthy = True
+        self.failures = 0
+        self.last_checked = 0.0
+
+    @property
+    def load(self) -> int:
+        # ComfyUI's own queue may include work we didn't send, so count both
+        return max(self.queue_depth, self.inflight)
+
+    def has_capacity(self) -> bool:
+        return self.healthy and self.inflight < self.max_inflight
+
+    def snapshot(self) -> dict:
+        return {
+            "address": self.address,
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "queue_depth": self.queue_depth,
+            "max_inflight": self.max_inflight,
+        }
+
+
+# ComfyUI backends with least-queue-depth routing, health probing and failover
+class ComfyPool:
+    def __init__(self, addresses: list[str], max_inflight_per_node: int = COMFYUI_MAX_INFLIGHT_PER_NODE):
+        if not addresses:
+            raise RuntimeError("No ComfyUI servers configured (COMFYUI_SERVERS / SERVER_ADDRESS)")
+        self.nodes = [ComfyNode(address, max_inflight_per_node) for address in addresses]
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, address: str) -> Optional[ComfyNode]:
+        return next((node for node in self.nodes if node.address == address), None)
+
+    def acquire(self) -> Optional[ComfyNode]:
+        candidates = [node for node in self.nodes if node.has_capacity()]
+        if not candidates:
+            return None
+        node = min(candidates, key=lambda n: (n.load, n.inflight))
+        node.inflight += 1
+        return node
+
+    def release(self, node: ComfyNode):
+        node.inflight = max(0, node.inflight - 1)
+
+    def transfer(self, source: ComfyNode, target: ComfyNode):
+        # move an admitted job's in-flight slot along with it when it fails over
+        if source is not target:
+            self.release(source)
+            target.inflight += 1
+
+    def pick(self, exclude: tuple[str, ...] = ()) -> Optional[ComfyNode]:
+        # failover target for work already admitted; ignores the in-flight cap
+        candidates = [n for n in self.nodes if n.healthy and n.address not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda n: (n.load, n.inflight))
+
+    def mark_success(self, node: ComfyNode):
+        node.failures = 0
+        if not node.healthy:
+            logger.info(f"💚 ComfyUI node {node.address} is healthy again")
+        node.healthy = True
+
+    def mark_failure(self, node: ComfyNode, error: str):
+        node.failures += 1
+        if node.healthy and node.failures >= COMFYUI_FAILURE_THRESHOLD:
+            node.healthy = False
+            logger.error(f"💔 ComfyUI node {node.address} marked unhealthy: {error}")
+            # prompts waiting on a dead node would otherwise sit until the prompt timeout
+            session = get_existing_ws_session(node.address)
+            if session is not None:
+                session.fail_pending(f"node {node.address} unhealthy: {error}")
+
+    async def probe(self, node: ComfyNode):
+        try:
+            queue = await get_comfy_client(node.address).get_queue()
+            node.queue_depth = len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+            self.mark_success(node)
+        except Exception as e:
+            # anything from a bad body to a dropped socket counts against the node;
+            # letting it escape would abort start() or end the health loop
+            self.mark_failure(node, str(e))
+        finally:
+            node.last_checked = time.time()
+
+    async def start(self):
+        await asyncio.gather(*(self.probe(node) for node in self.nodes))
+        self._task = asyncio.create_task(self._health_loop())
+        logger.info(f"🩺 ComfyUI pool started: {[node.snapshot() for node in self.nodes]}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await close_comfy_clients()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(COMFYUI_HEALTH_INTERVAL)
+            await asyncio.gather(*(self.probe(node) for node in self.nodes))
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import websocket
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WS_CONNECT_TIMEOUT = float(os.getenv("COMFYUI_WS_CONNECT_TIMEOUT", "10"))
+WS_RECONNECT_DELAY = float(os.getenv("COMFYUI_WS_RECONNECT_DELAY", "2"))
+FINISHED_BUFFER_SIZE = 512
+
+
+# One long-lived ComfyUI socket per process, fanning events out by prompt_id
+class ComfyWebSocketSession:
+    def __init__(self, server_address: str):
+        self.server_address = server_address
+        self.client_id = f"diffrun_{uuid.uuid4()}"
+        self.pid = os.getpid()
+        self._waiters: dict[str, Future] = {}
+        self._errors: dict[str, str] = {}
+        # prompts that finished before anyone called wait_for() on them
+        self._finished: OrderedDict[str, str | None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        # bumped on every (re)connect; a prompt queued under an older generation may
+        # have finished while the socket was down
+        self.generation = 0
+        self._ws = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"comfy-ws-{server_address}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive() and self.pid == os.getpid()
+
+    def wait_connected(self, timeout: float = WS_CONNECT_TIMEOUT) -> bool:
+        return self._connected.wait(timeout)
+
+    def wait_for(self, prompt_id: str, queued_generation: int | None = None) -> Future:
+        """Future for the prompt's completion. Pass the `generation` read before queueing
+        so a reconnect in between (whose recovery could not see this prompt) is caught."""
+        with self._lock:
+            if prompt_id in self._finished:
+                future = Future()
+                self._resolve(future, prompt_id, self._finished.pop(prompt_id))
+                return future
+
+            future = self._waiters.get(prompt_id)
+            if future is None:
+                future = Future()
+                self._waiters[prompt_id] = future
+            missed_reconnect = queued_generation is not None and queued_generation != self.generation
+
+        if missed_reconnect:
+            threading.Thread(
+                target=self._check_history, args=(prompt_id,),
+                name=f"comfy-history-{prompt_id}", daemon=True).start()
+        return future
+
+    def discard(self, prompt_id: str):
+        # drop a waiter nobody is listening to any more (timed out or cancelled)
+        with self._lock:
+            self._waiters.pop(prompt_id, None)
+
+    def fail_pending(self, reason: str):
+        with self._lock:
+            waiters = list(self._waiters.items())
+            self._waiters.clear()
+        for prompt_id, future in waiters:
+            self._resolve(future, prompt_id, reason)
+
+    def _run(self):
+        while True:
+            url = f"ws://{self.server_address}/ws?clientId={self.client_id}"
+            try:
+                self._ws = websocket.create_connection(url, timeout=WS_CONNECT_TIMEOUT)
+                self._ws.settimeout(None)
+                with self._lock:
+                    self.generation += 1
+                self._connected.set()
+                logger.info(f"🔌 Connected shared ComfyUI socket {url}")
+                self._recover_pending()
+
+                while True:
+                    out = self._ws.recv()
+                    if isinstance(out, str):
+                        self._dispatch(json.loads(out))
+            except Exception as e:
+                self._connected.clear()
+                logger.warning(f"⚠️ ComfyUI socket to {self.server_address} dropped: {e}")
+            finally:
+                if self._ws is not None:
+                    try:
+                        self._ws.close()
+                    except Exception:
+                        pass
+                    self._ws = None
+
+            time.sleep(WS_RECONNECT_DELAY)
+
+    def _dispatch(self, message: dict):
+        message_type = message.get("type")
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+
+        if message_type == "execution_error":
+            self._errors[prompt_id] = data.get("exception_message") or "execution_error"
+        elif message_type == "execution_interrupted":
+            self._errors[prompt_id] = "execution_interrupted"
+        elif message_type == "executing" and data.get("node") is None:
+            self._finish(prompt_id, self._errors.pop(prompt_id, None))
+
+    def _finish(self, prompt_id: str, error: str | None):
+        with self._lock:
+            future = self._waiters.pop(prompt_id, None)
+            if future is None:
+                self._finished[prompt_id] = error
+                while len(self._finished) > FINISHED_BUFFER_SIZE:
+                    self._finished.popitem(last=False)
+                return
+        self._resolve(future, prompt_id, error)
+
+    @staticmethod
+    def _resolve(future: Future, prompt_id: str, error: str | None):
+        if future.done():
+            return
+        if error:
+            future.set_exception(RuntimeError(f"ComfyUI prompt {prompt_id} failed: {error}"))
+        else:
+            future.set_result(prompt_id)
+
+    def _recover_pending(self):
+        # events sent while we were disconnected are lost, so ask history directly
+        with self._lock:
+            pending = list(self._waiters)
+
+        for prompt_id in pending:
+            self._check_history(prompt_id)
+
+    def _check_history(self, prompt_id: str):
+        try:
+            with urllib.request.urlopen(
+                    f"http://{self.server_address}/history/{prompt_id}",
+                    timeout=WS_CONNECT_TIMEOUT) as response:
+                history = json.loads(response.read())
+        except Exception as e:
+            logger.warning(f"⚠️ Could not check history for {prompt_id}: {e}")
+            return
+
+        if prompt_id in history:
+            status = history[prompt_id].get("status", {})
+            error = None if status.get("status_str", "success") == "success" else status.get("status_str")
+            logger.info(f"♻️ Recovered completion for prompt {prompt_id} after reconnect")
+            self._finish(prompt_id, error)
+
+
+_sessions: dict[str, ComfyWebSocketSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_ws_session(server_address: str) -> ComfyWebSocketSession:
+    with _sessions_lock:
+        session = _sessions.get(server_address)
+        # a forked worker inherits the dict but not the reader thread
+        if session is None or not session.is_alive():
+            session = ComfyWebSocketSession(server_address)
+            session.start()
+            _sessions[server_address] = session
+
+    if not session.wait_connected():
+        logger.warning(f"⚠️ ComfyUI socket to {server_address} not connected yet")
+    return session
+
+
+def get_existing_ws_session(server_address: str) -> ComfyWebSocketSession | None:
+    with _sessions_lock:
+        session = _sessions.get(server_address)
+    return session if session is not None and session.is_alive() else None
@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import Response
+
+load_dotenv()
+
+LONG_POLL_MAX_SECONDS = float(os.getenv("LONG_POLL_MAX_SECONDS", "30"))
+LONG_POLL_INTERVAL_SECONDS = float(os.getenv("LONG_POLL_INTERVAL_SECONDS", "1"))
+# with job events waking the waiter, the version is only re-read this often as a safety net
+LONG_POLL_FALLBACK_SECONDS = float(os.getenv("LONG_POLL_FALLBACK_SECONDS", "10"))
+
+# Clients may keep a copy but must revalidate it with If-None-Match every time
+REVALIDATE = "no-cache"
+
+
+def version_etag(job_id: str, version: int) -> str:
+    return f'W/"{job_id}-v{version}"'
+
+
+def content_etag(payload) -> str:
+    digest = hashlib.sha1(
+        json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as RFC 9110 requires for If-None-Match
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE
+
+
+async def wait_for_version_change(read_version: Callable[[], Awaitable[Optional[int]]],
+                                  version: int, timeout: float,
+                                  wakeups: Optional[asyncio.Queue] = None) -> Optional[int]:
+    """Long-poll: re-read the job's version until it moves past `version` or `timeout` runs out.
+
+    With `wakeups` (a job_events subscription) the version is re-read when an event
+    arrives, plus every LONG_POLL_FALLBACK_SECONDS for writes that publish nothing.
+    """
+    deadline = time.monotonic() + min(max(timeout, 0), LONG_POLL_MAX_SECONDS)
+    interval = LONG_POLL_INTERVAL_SECONDS
+    if wakeups is not None:
+        interval = LONG_POLL_FALLBACK_SECONDS
+        # catch a write that landed before the subscription was in place
+        current = await read_version()
+        if current != version:
+            return current
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return version
+        if wakeups is None:
+            await asyncio.sleep(min(interval, remaining))
+        else:
+            try:
+                await asyncio.wait_for(wakeups.get(), min(interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+        current = await read_version()
+        if current != version:
+            return current
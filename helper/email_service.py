@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import Future
+from email.message import EmailMessage
+from typing import Optional, Protocol
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+# SMTP_SSL=false with SMTP_STARTTLS=false gives a plain connection, e.g. a local sink on :1025
+SMTP_SSL = os.getenv("SMTP_SSL", "true").lower() == "true"
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+# servers drop idle sessions; reconnect rather than probe a connection older than this
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_BATCH_WINDOW_SECONDS = float(os.getenv("EMAIL_BATCH_WINDOW_SECONDS", "0.2"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "4"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "1"))
+
+
+class EmailTransport(Protocol):
+    def send_message(self, msg: EmailMessage): ...
+
+    def close(self): ...
+
+
+# One authenticated SMTP session, opened lazily and reused across sends
+class SmtpTransport:
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 use_ssl: bool = SMTP_SSL, starttls: bool = SMTP_STARTTLS,
+                 timeout: float = SMTP_TIMEOUT_SECONDS, idle_seconds: float = SMTP_IDLE_SECONDS):
+        self.host = host
+        self.port = port
+        self.username = username if username is not None else os.getenv("EMAIL_USER")
+        self.password = password if password is not None else os.getenv("EMAIL_PASS")
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        context = ssl.create_default_context()
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=context)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                smtp.starttls(context=context)
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        logger.info(f"📮 Opened SMTP session to {self.host}:{self.port}")
+        return smtp
+
+    def send_message(self, msg: EmailMessage):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(msg)
+        except (smtplib.SMTPException, OSError):
+            # a dropped socket or an error reply (421 etc.) can leave the session
+            # unusable; drop it so the retry starts on a fresh connection
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+
+def is_transient(error: Exception) -> bool:
+    """True for failures worth retrying: dropped connections and 4xx replies."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        return False  # e.g. SMTPNotSupportedError; retrying cannot help
+    return isinstance(error, OSError)
+
+
+class _Outgoing:
+    def __init__(self, msg: EmailMessage):
+        self.msg = msg
+        self.future: Future = Future()
+
+
+# Background send queue: one worker drains bursts in batches over a single session
+class EmailService:
+    def __init__(self, transport: EmailTransport, queue_size: int = EMAIL_QUEUE_SIZE,
+                 batch_size: int = EMAIL_BATCH_SIZE,
+                 batch_window: float = EMAIL_BATCH_WINDOW_SECONDS,
+                 max_attempts: int = EMAIL_MAX_ATTEMPTS):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_attempts = max_attempts
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="email-sender", daemon=True)
+                self._worker.start()
+
+    def send(self, msg: EmailMessage) -> Future:
+        """Queue a message and return at once; the future resolves when it is delivered."""
+        self.start()
+        outgoing = _Outgoing(msg)
+        try:
+            # never block: this is called straight from async handlers
+            self._queue.put_nowait(outgoing)
+        except queue.Full:
+            logger.error(f"❌ Email queue full ({self._queue.maxsize}), dropping email to {msg.get('To')}")
+            outgoing.future.set_exception(RuntimeError("Email send queue is full"))
+        return outgoing.future
+
+    def send_and_wait(self, msg: EmailMessage, timeout: Optional[float] = None):
+        return self.send(msg).result(timeout)
+
+    async def send_async(self, msg: EmailMessage):
+        return await asyncio.wrap_future(self.send(msg))
+
+    def _next_batch(self) -> Optional[list[_Outgoing]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # keep the stop marker for the next loop
+                break
+            batch.append(item)
+        return batch
+
+    def _deliver(self, outgoing: _Outgoing):
+        recipient = outgoing.msg.get("To")
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.transport.send_message(outgoing.msg)
+                logger.info(f"📧 Email sent to {recipient}: {outgoing.msg.get('Subject')}")
+                outgoing.future.set_result(None)
+                return
+            except Exception as e:
+                # permanent rejections (bad address, 5xx) fail at once instead of
+                # holding the single worker through the whole backoff
+                if attempt == self.max_attempts or not is_transient(e):
+                    logger.error(f"❌ Email to {recipient} failed after {attempt} attempt(s): {e}")
+                    outgoing.future.set_exception(e)
+                    return
+                delay = EMAIL_RETRY_BASE_SECONDS * (2 ** (attempt - 1))
+                logger.warning(f"⚠️ Email to {recipient} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            if len(batch) > 1:
+                logger.info(f"📬 Sending a batch of {len(batch)} email(s)")
+            for outgoing in batch:
+                self._deliver(outgoing)
+        self.transport.close()
+
+    def shutdown(self, wait: bool = True):
+        """Flush whatever is queued, then close the session."""
+        with self._lock:
+            worker = self._worker
+        if worker is None or not worker.is_alive():
+            self.transport.close()
+            return
+        self._queue.put(None)
+        if wait:
+            worker.join()
+
+
+email_service = EmailService(SmtpTransport())
@@ -0,0 +1,133 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from helper.watermark import apply_watermark
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(os.cpu_count() or 2)))
+IMAGE_WORKER_QUEUE_SIZE = int(os.getenv("IMAGE_WORKER_QUEUE_SIZE", str(IMAGE_WORKERS * 2)))
+
+
+# Function to convert PNG to a watermarked preview JPG (returns the JPEG bytes)
+def convert_png_to_jpg(png_data, watermark_path):
+    try:
+        img = Image.open(io.BytesIO(png_data))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        original_width, original_height = img.size
+        new_height = 720
+        new_width = int((original_width / original_height) * new_height)
+        img = img.resize((new_width, new_height))
+
+        # Cached, pre-faded watermark pasted straight onto the RGB frame
+        apply_watermark(img, watermark_path)
+
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        return buffer.getvalue()
+
+    except Exception as e:
+        raise ValueError(f"Error converting PNG to JPG: {str(e)}")
+
+
+def resize_to_jpeg(src_path: str, size: tuple[int, int],
+                   quality: int = 95, dpi: Optional[tuple[int, int]] = None) -> bytes:
+    with Image.open(src_path) as im:
+        im = im.convert("RGB")
+        im_resized = im.resize(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        save_kwargs = {"dpi": dpi} if dpi else {}
+        im_resized.save(buffer, format="JPEG", quality=quality, **save_kwargs)
+    return buffer.getvalue()
+
+
+# Process pool for CPU-bound PIL work so it never holds the API's GIL
+class ImageWorkerPool:
+    def __init__(self, max_workers: int = IMAGE_WORKERS, max_pending: int = IMAGE_WORKER_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        # submitters block once this many jobs are queued or running
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # async callers wait for a slot here, not in the loop's default executor, which
+        # the scheduler and the Mongo/disk to_thread helpers depend on
+        self._slot_waiter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-slots")
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: forking a process that holds Mongo clients and socket threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"))
+                    logger.info(
+                        f"🧮 Image worker pool started: {self.max_workers} process(es), "
+                        f"{self.max_pending} pending max")
+        return self._executor
+
+    def _submit_acquired(self, fn, *args, **kwargs) -> Future:
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue fn in a worker process, blocking the calling thread while the pool is full."""
+        self._slots.acquire()
+        return self._submit_acquired(fn, *args, **kwargs)
+
+    def try_submit(self, fn, *args, headroom: int = 0, **kwargs) -> Optional[Future]:
+        """Queue fn only if `headroom` slots stay free afterwards; returns None instead of waiting."""
+        taken = 0
+        while taken <= headroom and self._slots.acquire(blocking=False):
+            taken += 1
+        if taken <= headroom:
+            for _ in range(taken):
+                self._slots.release()
+            return None
+        for _ in range(headroom):
+            self._slots.release()
+        return self._submit_acquired(fn, *args, **kwargs)
+
+    def run_sync(self, fn, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn in a worker process; waits for a free slot without blocking the event loop."""
+        if not self._slots.acquire(blocking=False):
+            acquired = self._slot_waiter.submit(self._slots.acquire)
+            try:
+                await asyncio.wrap_future(acquired)
+            except asyncio.CancelledError:
+                # the acquire may still go through after we stop waiting; hand that slot back
+                acquired.add_done_callback(lambda f: f.cancelled() or self._slots.release())
+                raise
+        return await asyncio.wrap_future(self._submit_acquired(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+            logger.info("🧮 Image worker pool stopped")
+
+
+image_workers = ImageWorkerPool()
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENTS_QUEUE_SIZE = int(os.getenv("JOB_EVENTS_QUEUE_SIZE", "100"))
+JOB_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# In-process fan-out of per-job progress events to SSE subscribers
+class JobEventBroker:
+    def __init__(self, queue_size: int = JOB_EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str) -> AsyncIterator[asyncio.Queue]:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    self._subscribers.pop(job_id, None)
+
+    def _deliver(self, job_id: str, message: str):
+        for queue in list(self._subscribers.get(job_id, ())):
+            if queue.full():
+                # a stalled client loses its oldest event rather than blocking everyone else
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def publish(self, job_id: str, event: str, data: dict):
+        """Fan an event out to this job's subscribers; safe to call from worker threads."""
+        if self._loop is None or job_id not in self._subscribers:
+            return
+        message = format_sse(event, {"job_id": job_id, **data})
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(job_id, message)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, job_id, message)
+
+    async def stream(self, job_id: str, snapshot: dict, is_disconnected) -> AsyncIterator[str]:
+        async with self.subscribe(job_id) as queue:
+            yield format_sse("snapshot", {"job_id": job_id, **snapshot})
+            while not await is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), JOB_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+
+
+job_events = JobEventBroker()
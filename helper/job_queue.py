@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+from helper.comfy_pool import ComfyNode, ComfyPool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GPU_JOB_LEASE_SECONDS = int(os.getenv("GPU_JOB_LEASE_SECONDS", "120"))
+GPU_JOB_MAX_ATTEMPTS = int(os.getenv("GPU_JOB_MAX_ATTEMPTS", "3"))
+GPU_JOB_RETRY_DELAY_SECONDS = int(os.getenv("GPU_JOB_RETRY_DELAY_SECONDS", "15"))
+GPU_SCHEDULER_POLL_SECONDS = float(os.getenv("GPU_SCHEDULER_POLL_SECONDS", "2"))
+GPU_SCHEDULER_REAP_SECONDS = float(os.getenv("GPU_SCHEDULER_REAP_SECONDS", "30"))
+# finished jobs are kept this long for debugging, then dropped by a TTL index
+GPU_JOB_RETENTION_DAYS = int(os.getenv("GPU_JOB_RETENTION_DAYS", "7"))
+
+# Higher runs first: paying customers and print approvals never wait behind free previews
+PRIORITY_PREVIEW = 0
+PRIORITY_REGENERATE = 50
+PRIORITY_PAID = 100
+PRIORITY_COVER = 150
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+# Durable GPU work queue stored in MongoDB; workers claim jobs under a lease
+class GpuJobQueue:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index(
+            [("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)],
+            name="claim_order")
+        self.collection.create_index(
+            [("job_id", ASCENDING), ("workflow_key", ASCENDING), ("status", ASCENDING)],
+            name="job_workflow_status")
+        # only completed/failed jobs carry finished_at, so queued and running work never expires
+        self.collection.create_index(
+            [("finished_at", ASCENDING)], name="finished_ttl",
+            expireAfterSeconds=GPU_JOB_RETENTION_DAYS * 24 * 3600)
+
+    @staticmethod
+    def _enqueue_op(kind: str, job_id: str, payload: dict, priority: int,
+                    workflow_key: Optional[str], max_attempts: int) -> tuple[dict, dict]:
+        now = datetime.now(timezone.utc)
+        # a page that is already waiting is refreshed instead of queued twice
+        return (
+            {"job_id": job_id, "workflow_key": workflow_key,
+             "kind": kind, "status": STATUS_QUEUED},
+            {
+                "$set": {
+                    "payload": payload,
+                    "priority": priority,
+                    "max_attempts": max_attempts,
+                    "available_at": now,
+                    "updated_at": now,
+                },
+                "$setOnInsert": {"attempts": 0, "created_at": now},
+            },
+        )
+
+    def enqueue(self, kind: str, job_id: str, payload: dict, priority: int = 0,
+                workflow_key: Optional[str] = None, max_attempts: int = GPU_JOB_MAX_ATTEMPTS) -> dict:
+        query, update = self._enqueue_op(kind, job_id, payload, priority, workflow_key, max_attempts)
+        return self.collection.find_one_and_update(
+            query, update, upsert=True, return_document=ReturnDocument.AFTER)
+
+    def enqueue_many(self, kind: str, job_id: str, pages: list[tuple[dict, Optional[str]]],
+                     priority: int = 0, max_attempts: int = GPU_JOB_MAX_ATTEMPTS) -> int:
+        """Queue several (payload, workflow_key) pages of one job in a single bulk write."""
+        if not pages:
+            return 0
+        operations = [
+            UpdateOne(*self._enqueue_op(kind, job_id, payload, priority, workflow_key, max_attempts),
+                      upsert=True)
+            for payload, workflow_key in pages
+        ]
+        result = self.collection.bulk_write(operations, ordered=False)
+        return result.upserted_count + result.modified_count
+
+    def promote(self, job_id: str, priority: int) -> int:
+        result = self.collection.update_many(
+            {"job_id": job_id, "status": STATUS_QUEUED, "priority": {"$lt": priority}},
+            {"$set": {"priority": priority, "updated_at": datetime.now(timezone.utc)}})
+        return result.modified_count
+
+    def claim(self, owner: str, lease_seconds: int = GPU_JOB_LEASE_SECONDS) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": STATUS_QUEUED, "available_at": {"$lte": now}},
+                    # the owner died mid-run; take the job over if it has attempts left
+                    {"status": STATUS_RUNNING, "lease_expires_at": {"$lt": now},
+                     "$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": STATUS_RUNNING,
+                    "owner": owner,
+                    "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def fail_abandoned(self) -> list[dict]:
+        """Fail jobs whose lease ran out on their last attempt, e.g. after the process crashed."""
+        now = datetime.now(timezone.utc)
+        failed = []
+        while True:
+            job = self.collection.find_one_and_update(
+                {"status": STATUS_RUNNING, "lease_expires_at": {"$lt": now},
+                 "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+                {"$set": {"status": STATUS_FAILED,
+                          "error": "lease expired on the final attempt",
+                          "finished_at": now,
+                          "updated_at": now},
+                 "$unset": {"lease_expires_at": ""}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return failed
+            failed.append(job)
+
+    def heartbeat(self, job: dict, lease_seconds: int = GPU_JOB_LEASE_SECONDS):
+        now = datetime.now(timezone.utc)
+        self.collection.update_one(
+            {"_id": job["_id"], "owner": job["owner"], "status": STATUS_RUNNING},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=lease_seconds),
+                      "updated_at": now}})
+
+    def complete(self, job: dict):
+        self.collection.update_one(
+            {"_id": job["_id"], "owner": job["owner"]},
+            {"$set": {"status": STATUS_COMPLETED,
+                      "finished_at": datetime.now(timezone.utc),
+                      "updated_at": datetime.now(timezone.utc)},
+             "$unset": {"lease_expires_at": ""}})
+
+    def fail(self, job: dict, error: str) -> bool:
+        now = datetime.now(timezone.utc)
+        retry = job.get("attempts", 1) < job.get("max_attempts", GPU_JOB_MAX_ATTEMPTS)
+        update = {"error": error, "updated_at": now}
+        if retry:
+            update["status"] = STATUS_QUEUED
+            update["available_at"] = now + timedelta(
+                seconds=GPU_JOB_RETRY_DELAY_SECONDS * job.get("attempts", 1))
+        else:
+            update["status"] = STATUS_FAILED
+            update["finished_at"] = now
+
+        self.collection.update_one(
+            {"_id": job["_id"], "owner": job["owner"]},
+            {"$set": update, "$unset": {"lease_expires_at": ""}})
+        return retry
+
+
+JobHandler = Callable[..., Awaitable[None]]
+StatusCallback = Callable[[dict, str], None]
+
+
+# Pulls jobs by priority and caps how many prompts are in flight on each ComfyUI node
+class GpuScheduler:
+    def __init__(self, queue: GpuJobQueue, pool: ComfyPool,
+                 status_callback: Optional[StatusCallback] = None):
+        self.queue = queue
+        self.pool = pool
+        self.status_callback = status_callback
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: dict[str, JobHandler] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, job_id: str, payload: dict, priority: int = PRIORITY_PREVIEW,
+               workflow_key: Optional[str] = None) -> dict:
+        job = self.queue.enqueue(kind, job_id, payload, priority=priority, workflow_key=workflow_key)
+        logger.info(f"📥 Queued {kind} job for job_id={job_id} ({workflow_key}, priority={priority})")
+        self.notify()
+        return job
+
+    def submit_many(self, kind: str, job_id: str, pages: list[tuple[dict, Optional[str]]],
+                    priority: int = PRIORITY_PREVIEW) -> int:
+        queued = self.queue.enqueue_many(kind, job_id, pages, priority=priority)
+        logger.info(f"📥 Queued {len(pages)} {kind} job(s) for job_id={job_id} (priority={priority})")
+        self.notify()
+        return queued
+
+    def promote(self, job_id: str, priority: int):
+        promoted = self.queue.promote(job_id, priority)
+        if promoted:
+            logger.info(f"⏫ Promoted {promoted} queued job(s) for job_id={job_id} to priority={priority}")
+
+    def notify(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self.queue.ensure_indexes)
+        self._task = asyncio.create_task(self._run())
+        self._reaper = asyncio.create_task(self._reap_loop())
+        logger.info(f"🗓️ GPU scheduler {self.owner} started on {len(self.pool.nodes)} ComfyUI node(s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._reaper:
+            self._reaper.cancel()
+        for task in list(self._running):
+            task.cancel()
+        # cancelled jobs keep their lease and are picked up again once it expires
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), GPU_SCHEDULER_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            node = self.pool.acquire()
+            if node is None:
+                # every healthy node is at its in-flight cap
+                await self._idle()
+                continue
+
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.owner)
+            except Exception as e:
+                logger.error(f"❌ Failed to claim GPU job: {e}")
+                job = None
+
+            if job is None:
+                self.pool.release(node)
+                await self._idle()
+                continue
+
+            task = asyncio.create_task(self._execute(job, node))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(GPU_SCHEDULER_REAP_SECONDS)
+            try:
+                abandoned = await asyncio.to_thread(self.queue.fail_abandoned)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to reap abandoned GPU jobs: {e}")
+                continue
+            for job in abandoned:
+                logger.error(
+                    f"❌ GPU job {job['_id']} lost its lease on attempt {job['attempts']} — giving up")
+                if self.status_callback:
+                    await asyncio.to_thread(self.status_callback, job, STATUS_FAILED)
+
+    async def _heartbeat(self, job: dict):
+        while True:
+            await asyncio.sleep(GPU_JOB_LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self.queue.heartbeat, job)
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat failed for GPU job {job['_id']}: {e}")
+
+    async def _execute(self, job: dict, node: ComfyNode):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            handler = self._handlers.get(job["kind"])
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind '{job['kind']}'")
+
+            logger.info(
+                f"🚦 Running {job['kind']} for job_id={job['job_id']} "
+                f"({job.get('workflow_key')}, attempt {job['attempts']}) on {node.address}")
+            await handler(job_id=job["job_id"], server_address=node.address, **job["payload"])
+            await asyncio.to_thread(self.queue.complete, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            retry = await asyncio.to_thread(self.queue.fail, job, str(e))
+            logger.error(
+                f"❌ GPU job {job['_id']} failed (attempt {job['attempts']}): {e}"
+                + (" — will retry" if retry else " — giving up"))
+            if self.status_callback:
+                await asyncio.to_thread(
+                    self.status_callback, job, "processing" if retry else "failed")
+        finally:
+            heartbeat.cancel()
+            self.pool.release(node)
+            self._wakeup.set()
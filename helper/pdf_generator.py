@@ -1,41 +1,120 @@
+import logging
 import os
+from collections import deque
+from concurrent.futures import Future
 import fitz  # PyMuPDF
-from PIL import Image
-from typing import List
+from typing import List, Optional
+
+from helper.image_workers import image_workers, resize_to_jpeg
+
+logger = logging.getLogger(__name__)
 
 PAGE_WIDTH_PT = 612   # 8.5 inches * 72 = 612
 PAGE_HEIGHT_PT = 612  # Square format (8.5 x 8.5)
 TARGET_SIZE_PX = (2550, 2550)  # 8.5" x 300 DPI
-TEMP_JPEG = "temp_resized_image.jpg"
+PRINT_READY_DIR = "print_ready"
+# pre-renders only run while this many pool slots stay free for preview encoding
+PRINT_PRERENDER_HEADROOM = int(os.getenv("PRINT_PRERENDER_HEADROOM", "2"))
 
-def create_interior_pdf(source_folder: str, output_pdf: str, selectedSlides: List[int], job_id: str):
-    temp_path = os.path.join(source_folder, TEMP_JPEG)
 
-    with fitz.open() as doc:
-        for idx, variant_index in enumerate(selectedSlides):
-            if variant_index is None:
-                continue
+def print_ready_path(cache_folder: str, png_path: str) -> str:
+    # one cached render per (page, variant) PNG name
+    stem = os.path.splitext(os.path.basename(png_path))[0]
+    return os.path.join(cache_folder, f"{stem}.jpg")
 
-            page_num = idx + 1  # Match filenames that start from 01
-            variant_num = variant_index + 1
 
-            filename = f"_{job_id}_{page_num:02d}_{variant_num:05d}_.png"
-            img_path = os.path.join(source_folder, filename)
+def render_print_page(png_path: str, cache_folder: str) -> str:
+    """Write the 300-DPI print JPEG for one interior PNG; runs in the image worker pool."""
+    os.makedirs(cache_folder, exist_ok=True)
+    dest_path = print_ready_path(cache_folder, png_path)
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(resize_to_jpeg(png_path, TARGET_SIZE_PX, 95, (300, 300)))
+    os.replace(tmp_path, dest_path)
+    return dest_path
 
-            if not os.path.exists(img_path):
-                raise FileNotFoundError(f"Image not found for PDF: {img_path}")
 
-            with Image.open(img_path).convert("RGB") as im:
-                im_resized = im.resize(TARGET_SIZE_PX, Image.LANCZOS)
-                im_resized.save(temp_path, format="JPEG", quality=95, dpi=(300, 300))
+def prerender_print_page(png_path: str, cache_folder: str) -> Optional[Future]:
+    """Queue a background print render as soon as a page PNG lands on disk.
 
-                page = doc.new_page(width=PAGE_WIDTH_PT, height=PAGE_HEIGHT_PT)
-                insert_rect = fitz.Rect(0, 0, PAGE_WIDTH_PT, PAGE_HEIGHT_PT)
-                page.insert_image(insert_rect, filename=temp_path)
+    Never waits: when the pool is busy the page is skipped and approval renders it on demand.
+    """
+    future = image_workers.try_submit(
+        render_print_page, png_path, cache_folder, headroom=PRINT_PRERENDER_HEADROOM)
+    if future is None:
+        logger.info(f"⏭️ Image pool busy, skipping print pre-render for {png_path}")
+        return None
 
-        doc.save(output_pdf)
+    def report(done):
+        if done.exception() is not None:
+            logger.warning(f"⚠️ Print pre-render failed for {png_path}: {done.exception()}")
+
+    future.add_done_callback(report)
+    return future
+
+
+def load_print_page(png_path: str, cache_folder: Optional[str]) -> Optional[bytes]:
+    if not cache_folder:
+        return None
+    cached = print_ready_path(cache_folder, png_path)
+    try:
+        # a page regenerated after its render invalidates the cached copy
+        if os.path.getmtime(cached) < os.path.getmtime(png_path):
+            return None
+        with open(cached, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def create_interior_pdf(source_folder: str, output_pdf: str, selectedSlides: List[int], job_id: str,
+                        cache_folder: Optional[str] = None):
+    img_paths = []
+    for idx, variant_index in enumerate(selectedSlides):
+        if variant_index is None:
+            continue
 
-    if os.path.exists(temp_path):
-        os.remove(temp_path)
+        page_num = idx + 1  # Match filenames that start from 01
+        variant_num = variant_index + 1
+
+        filename = f"_{job_id}_{page_num:02d}_{variant_num:05d}_.png"
+        img_path = os.path.join(source_folder, filename)
+
+        if not os.path.exists(img_path):
+            raise FileNotFoundError(f"Image not found for PDF: {img_path}")
+        img_paths.append(img_path)
+
+    # Pre-rendered pages are stitched as-is; the rest are resized in worker processes
+    # while earlier ones are inserted, in order
+    window = max(1, image_workers.max_pending)
+    pending = deque()
+    paths = iter(img_paths)
+    cache_hits = 0
+
+    with fitz.open() as doc:
+        while True:
+            while len(pending) < window:
+                img_path = next(paths, None)
+                if img_path is None:
+                    break
+                cached = load_print_page(img_path, cache_folder)
+                if cached is not None:
+                    cache_hits += 1
+                    pending.append(cached)
+                else:
+                    pending.append(image_workers.submit(
+                        resize_to_jpeg, img_path, TARGET_SIZE_PX, 95, (300, 300)))
+            if not pending:
+                break
+
+            page_jpeg = pending.popleft()
+            if not isinstance(page_jpeg, bytes):
+                page_jpeg = page_jpeg.result()
+
+            page = doc.new_page(width=PAGE_WIDTH_PT, height=PAGE_HEIGHT_PT)
+            insert_rect = fitz.Rect(0, 0, PAGE_WIDTH_PT, PAGE_HEIGHT_PT)
+            page.insert_image(insert_rect, stream=page_jpeg)
+
+        doc.save(output_pdf)
 
-    print(f"✅ Interior PDF saved to: {output_pdf}")
\ No newline at end of file
+    print(f"✅ Interior PDF saved to: {output_pdf} ({cache_hits}/{len(img_paths)} pages pre-rendered)")
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRINT_SPECS_PATH = os.getenv(
+    "PRINT_SPECS_PATH", os.path.join(os.path.dirname(__file__), "print_specs.json"))
+
+
+class CoverSpec(NamedTuple):
+    page_width_pt: int
+    page_height_pt: int
+    target_size_px: tuple[int, int]
+
+
+def _pair(value, field: str, where: str) -> tuple[int, int]:
+    if (not isinstance(value, list) or len(value) != 2
+            or not all(isinstance(v, int) and v > 0 for v in value)):
+        raise ValueError(f"Invalid {field} for {where}: expected two positive integers, got {value!r}")
+    return value[0], value[1]
+
+
+# Cover page/pixel sizes per book_style × book_id, read once from print_specs.json
+class PrintSpecRegistry:
+    def __init__(self, path: str = PRINT_SPECS_PATH):
+        self.path = path
+        self._covers: dict[tuple[str, str], CoverSpec] = {}
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not data:
+            raise ValueError(f"Print spec file {self.path} must map book_style to books")
+
+        covers = {}
+        for book_style, books in data.items():
+            if not isinstance(books, dict) or not books:
+                raise ValueError(f"Print spec for '{book_style}' must map book_id to a spec")
+            for book_id, spec in books.items():
+                where = f"{book_style}/{book_id}"
+                if not isinstance(spec, dict):
+                    raise ValueError(f"Print spec for {where} must be an object")
+                page_width_pt, page_height_pt = _pair(spec.get("page_pt"), "page_pt", where)
+                covers[(book_style, book_id)] = CoverSpec(
+                    page_width_pt, page_height_pt, _pair(spec.get("target_px"), "target_px", where))
+
+        self._covers = covers
+        logger.info(f"🖨️ Loaded {len(covers)} cover print spec(s) from {self.path}")
+
+    def cover(self, book_style: str, book_id: str) -> CoverSpec:
+        if not self._covers:
+            self.load()
+        spec = self._covers.get((book_style, book_id))
+        if spec is None:
+            styles = sorted({style for style, _ in self._covers})
+            if book_style not in styles:
+                raise ValueError(f"Unknown book_style: {book_style} (expected one of {styles})")
+            raise ValueError(f"No {book_style} cover print spec for book_id: {book_id}")
+        return spec
+
+
+print_specs = PrintSpecRegistry()
@@ -0,0 +1,87 @@
+import asyncio
+import io
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from boto3.s3.transfer import TransferConfig
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "8"))
+S3_UPLOAD_MAX_ATTEMPTS = int(os.getenv("S3_UPLOAD_MAX_ATTEMPTS", "4"))
+S3_UPLOAD_RETRY_BASE_SECONDS = float(os.getenv("S3_UPLOAD_RETRY_BASE_SECONDS", "0.5"))
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16"))
+S3_MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", "16"))
+S3_MULTIPART_CONCURRENCY = int(os.getenv("S3_MULTIPART_CONCURRENCY", "8"))
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * MB,
+    multipart_chunksize=S3_MULTIPART_CHUNK_MB * MB,
+    max_concurrency=S3_MULTIPART_CONCURRENCY,
+    use_threads=True,
+)
+
+
+# Shared upload service: one transfer config, a bounded thread pool and retry with backoff
+class S3Uploader:
+    def __init__(self, client, max_workers: int = S3_UPLOAD_WORKERS,
+                 transfer_config: TransferConfig = TRANSFER_CONFIG,
+                 max_attempts: int = S3_UPLOAD_MAX_ATTEMPTS):
+        self.client = client
+        self.transfer_config = transfer_config
+        self.max_attempts = max_attempts
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-upload")
+
+    def _with_retry(self, action: str, fn):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    logger.error(f"❌ S3 upload {action} failed after {attempt} attempt(s): {e}")
+                    raise
+                delay = S3_UPLOAD_RETRY_BASE_SECONDS * (2 ** (attempt - 1))
+                logger.warning(f"⚠️ S3 upload {action} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    @staticmethod
+    def _extra_args(content_type: Optional[str]) -> Optional[dict]:
+        return {"ContentType": content_type} if content_type else None
+
+    def upload_file(self, path: str, bucket: str, key: str, content_type: Optional[str] = None) -> str:
+        self._with_retry(f"s3://{bucket}/{key}", lambda: self.client.upload_file(
+            path, bucket, key,
+            ExtraArgs=self._extra_args(content_type), Config=self.transfer_config))
+        logger.info(f"📤 Uploaded to S3: s3://{bucket}/{key}")
+        return key
+
+    def upload_bytes(self, data: bytes, bucket: str, key: str, content_type: Optional[str] = None) -> str:
+        # a fresh buffer per attempt; a failed multipart upload leaves the old one consumed
+        self._with_retry(f"s3://{bucket}/{key}", lambda: self.client.upload_fileobj(
+            io.BytesIO(data), bucket, key,
+            ExtraArgs=self._extra_args(content_type), Config=self.transfer_config))
+        logger.info(f"📤 Uploaded to S3: s3://{bucket}/{key}")
+        return key
+
+    def submit_file(self, path: str, bucket: str, key: str, content_type: Optional[str] = None) -> Future:
+        return self._executor.submit(self.upload_file, path, bucket, key, content_type)
+
+    def submit_bytes(self, data: bytes, bucket: str, key: str, content_type: Optional[str] = None) -> Future:
+        return self._executor.submit(self.upload_bytes, data, bucket, key, content_type)
+
+    async def upload_file_async(self, path: str, bucket: str, key: str, content_type: Optional[str] = None) -> str:
+        return await asyncio.wrap_future(self.submit_file(path, bucket, key, content_type))
+
+    async def upload_bytes_async(self, data: bytes, bucket: str, key: str, content_type: Optional[str] = None) -> str:
+        return await asyncio.wrap_future(self.submit_bytes(data, bucket, key, content_type))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # optional; without it only .gz variants are produced
+    brotli = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FRONTEND_OUT = os.getenv("FRONTEND_OUT", "frontend/out")
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "86400"))
+
+# Next.js puts content-hashed bundles under _next/static; they never change in place
+IMMUTABLE_PREFIXES = ("_next/static/",)
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+HTML_CACHE = "no-cache"
+PRECOMPRESSED = ((".br", "br"), (".gz", "gzip"))
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json",
+                      "image/svg+xml", "application/xml", "application/manifest+json")
+
+
+def cache_control_for(relative_path: str) -> str:
+    relative_path = relative_path.replace(os.sep, "/").lstrip("/")
+    if relative_path.startswith(IMMUTABLE_PREFIXES):
+        return IMMUTABLE_CACHE
+    if relative_path.endswith(".html"):
+        return HTML_CACHE
+    return f"public, max-age={STATIC_MAX_AGE}"
+
+
+def accepted_encodings(headers: Headers) -> set[str]:
+    accepted = set()
+    for part in headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(coding.lower())
+    return accepted
+
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    return bool(media_type) and media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class _HtmlShell:
+    def __init__(self, path: str, mtime: float, body: bytes):
+        self.path = path
+        self.mtime = mtime
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=9)
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+# Built HTML pages held in memory (plus a gzip copy); reloaded when the file's mtime moves
+class HtmlShellCache:
+    def __init__(self, root: str = FRONTEND_OUT):
+        self.root = root
+        self._shells: dict[str, _HtmlShell] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> _HtmlShell:
+        mtime = os.path.getmtime(path)
+        shell = self._shells.get(path)
+        if shell is None or shell.mtime != mtime:
+            with open(path, "rb") as f:
+                body = f.read()
+            shell = _HtmlShell(path, mtime, body)
+            with self._lock:
+                self._shells[path] = shell
+        return shell
+
+    def response(self, path: str, request_headers: Headers) -> Response:
+        shell = self.get(path)
+        headers = {"ETag": shell.etag, "Cache-Control": HTML_CACHE, "Vary": "Accept-Encoding"}
+        if_none_match = request_headers.get("if-none-match", "")
+        if any(tag.strip().removeprefix("W/") == shell.etag for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+
+        if "gzip" in accepted_encodings(request_headers):
+            headers["Content-Encoding"] = "gzip"
+            return Response(shell.gzip_body, media_type="text/html", headers=headers)
+        return Response(shell.body, media_type="text/html", headers=headers)
+
+    def page(self, name: str, request: Request) -> Response:
+        return self.response(os.path.join(self.root, name), request.headers)
+
+
+html_shells = HtmlShellCache()
+
+
+# StaticFiles with cache headers, precompressed .br/.gz variants and in-memory HTML
+class CachedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        full_path = os.fspath(full_path)
+        request_headers = Headers(scope=scope)
+
+        if full_path.endswith(".html") and status_code == 200:
+            return html_shells.response(full_path, request_headers)
+
+        relative_path = os.path.relpath(full_path, self.directory) if self.directory else full_path
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        headers = {"Cache-Control": cache_control_for(relative_path)}
+
+        serve_path, serve_stat = full_path, stat_result
+        if is_compressible(media_type):
+            headers["Vary"] = "Accept-Encoding"
+            # byte ranges are defined on the identity body, so ranged requests skip the variants
+            if "range" not in request_headers:
+                accepted = accepted_encodings(request_headers)
+                for suffix, coding in PRECOMPRESSED:
+                    if coding not in accepted:
+                        continue
+                    try:
+                        serve_stat = os.stat(full_path + suffix)
+                    except OSError:
+                        continue
+                    if serve_stat.st_mtime < stat_result.st_mtime:
+                        continue  # stale variant left over from an older build
+                    serve_path = full_path + suffix
+                    headers["Content-Encoding"] = coding
+                    break
+                else:
+                    serve_stat = stat_result
+
+        # FileResponse handles Range / If-Range itself and advertises Accept-Ranges
+        response = FileResponse(
+            serve_path, status_code=status_code, stat_result=serve_stat,
+            media_type=media_type, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress_directory(root: str = FRONTEND_OUT, min_size: int = 1024) -> int:
+    """Write .gz (and .br when brotli is installed) next to every compressible file."""
+    written = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith((".gz", ".br")):
+                continue
+            path = os.path.join(dirpath, filename)
+            if not is_compressible(mimetypes.guess_type(path)[0]) or os.path.getsize(path) < min_size:
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+
+            variants = [(".gz", lambda data: gzip.compress(data, compresslevel=9))]
+            if brotli is not None:
+                variants.append((".br", lambda data: brotli.compress(data, quality=11)))
+            for suffix, compress in variants:
+                with open(path + suffix, "wb") as f:
+                    f.write(compress(body))
+                written += 1
+
+    logger.info(f"🗜️ Wrote {written} precompressed file(s) under {root}")
+    return written
+
+
+if __name__ == "__main__":
+    # Run after `next build`: python -m helper.static_assets [frontend/out]
+    import sys
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    precompress_directory(sys.argv[1] if len(sys.argv) > 1 else FRONTEND_OUT)
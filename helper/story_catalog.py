@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STORIES_FOLDER = os.path.normpath(os.getenv("STORIES_FOLDER"))
+STORY_CATALOG_REFRESH_SECONDS = float(os.getenv("STORY_CATALOG_REFRESH_SECONDS", "30"))
+
+PAGE_DIR_RE = re.compile(r'pg(\d+)')
+
+
+# In-memory index of STORIES_FOLDER/<book_id>/<gender>/pgN/NN_<book_id>_<gender>.json
+class StoryCatalog:
+    def __init__(self, root: str = STORIES_FOLDER, refresh_seconds: float = STORY_CATALOG_REFRESH_SECONDS):
+        self.root = root
+        self.refresh_seconds = refresh_seconds
+        self._workflows: dict[tuple[str, str], List[tuple[int, str]]] = {}
+        self._paths: dict[tuple[str, str, int], str] = {}
+        self._dir_mtimes: dict[str, Optional[float]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self):
+        workflows = {}
+        paths = {}
+        dir_mtimes = {}
+
+        def track(path):
+            try:
+                dir_mtimes[path] = os.stat(path).st_mtime
+                return True
+            except OSError:
+                return False
+
+        if track(self.root):
+            for book_id in os.listdir(self.root):
+                book_dir = os.path.join(self.root, book_id)
+                if not os.path.isdir(book_dir):
+                    continue
+                track(book_dir)
+
+                for gender in os.listdir(book_dir):
+                    gender_dir = os.path.join(book_dir, gender)
+                    if not os.path.isdir(gender_dir):
+                        continue
+                    track(gender_dir)
+
+                    pages = []
+                    for entry in os.listdir(gender_dir):
+                        match = PAGE_DIR_RE.match(entry)
+                        page_dir = os.path.join(gender_dir, entry)
+                        if not match or not os.path.isdir(page_dir):
+                            continue
+                        track(page_dir)
+
+                        page_num = int(match.group(1))
+                        expected_file = f"{page_num:02d}_{book_id}_{gender}.json"
+                        workflow_path = os.path.abspath(os.path.join(page_dir, expected_file))
+                        if os.path.exists(workflow_path):
+                            pages.append((page_num, expected_file))
+                            paths[(book_id, gender, page_num)] = workflow_path
+                        else:
+                            logger.warning(f"⚠️ Workflow file missing: {workflow_path}")
+
+                    workflows[(book_id, gender)] = sorted(pages, key=lambda x: x[0])
+        else:
+            logger.error(f"❌ Stories folder does not exist: {self.root}")
+            # remember it as missing so only its appearance triggers a reload
+            dir_mtimes[self.root] = None
+
+        with self._lock:
+            self._workflows = workflows
+            self._paths = paths
+            self._dir_mtimes = dir_mtimes
+            self._loaded = True
+
+        logger.info(f"📚 Story catalog loaded: {len(workflows)} book/gender combos, {len(paths)} pages")
+
+    def _is_stale(self) -> bool:
+        # adding/removing a book, gender, page dir or page file bumps one of these mtimes
+        for path, mtime in self._dir_mtimes.items():
+            try:
+                current = os.stat(path).st_mtime
+            except OSError:
+                current = None
+            if current != mtime:
+                return True
+        return False
+
+    def refresh_if_stale(self):
+        if not self._loaded:
+            self.load()
+        elif self._is_stale():
+            logger.info("🔄 Story folder changed, reloading catalog")
+            self.load()
+
+    def _ensure_loaded(self):
+        # lookups only read memory; staleness is checked by the background refresh
+        if not self._loaded:
+            self.load()
+
+    async def start(self):
+        await asyncio.to_thread(self.load)
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await asyncio.to_thread(self.refresh_if_stale)
+            except Exception as e:
+                logger.error(f"❌ Story catalog refresh failed: {e}")
+
+    def workflows(self, book_id: str, gender: str) -> List[tuple[int, str]]:
+        self._ensure_loaded()
+        pages = self._workflows.get((book_id, gender))
+        if pages is None:
+            raise FileNotFoundError(
+                f"Base folder not found: {os.path.join(self.root, book_id, gender)}")
+        return list(pages)
+
+    def workflow_path(self, book_id: str, gender: str, page_num: int) -> Optional[str]:
+        self._ensure_loaded()
+        return self._paths.get((book_id, gender, page_num))
+
+    def total_workflows(self, book_id: str, gender: str) -> int:
+        self._ensure_loaded()
+        return len(self._workflows.get((book_id, gender), []))
+
+
+story_catalog = StoryCatalog()
@@ -0,0 +1,51 @@
+import logging
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from PIL import Image
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_OPACITY = 0.2
+WATERMARK_SCALE = 0.5
+WATERMARK_CACHE_SIZE = int(os.getenv("WATERMARK_CACHE_SIZE", "32"))
+
+# Alpha fade as a 256-entry table so Pillow applies it in C instead of calling a lambda
+OPACITY_LUT = [int(x * WATERMARK_OPACITY) for x in range(256)]
+
+
+@lru_cache(maxsize=4)
+def _load_source(watermark_path: str, mtime: float) -> Image.Image:
+    watermark = Image.open(watermark_path).convert("RGBA")
+    watermark.load()
+    return watermark
+
+
+@lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def _faded_watermark(watermark_path: str, mtime: float, size: tuple[int, int]) -> tuple[Image.Image, Image.Image]:
+    watermark = _load_source(watermark_path, mtime).resize(size)
+    r, g, b, a = watermark.split()
+    logger.info(f"💧 Prepared {size[0]}x{size[1]} watermark from {watermark_path}")
+    return Image.merge("RGB", (r, g, b)), a.point(OPACITY_LUT)
+
+
+def get_watermark(watermark_path: str, frame_size: tuple[int, int]) -> tuple[Image.Image, Image.Image]:
+    """Return the (RGB, alpha mask) watermark for a frame, faded and scaled to half its size."""
+    width, height = frame_size
+    size = (int(width * WATERMARK_SCALE), int(height * WATERMARK_SCALE))
+    # keyed on mtime so replacing the watermark file takes effect without a restart
+    return _faded_watermark(watermark_path, os.path.getmtime(watermark_path), size)
+
+
+def apply_watermark(img: Image.Image, watermark_path: str) -> Image.Image:
+    """Centre the cached watermark on an RGB image in place and return it."""
+    watermark, mask = get_watermark(watermark_path, img.size)
+    position = (
+        (img.width - watermark.width) // 2,
+        (img.height - watermark.height) // 2
+    )
+    img.paste(watermark, position, mask)
+    return img
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import threading
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INPUT_FOLDER = os.path.normpath(os.getenv("INPUT_FOLDER"))
+
+# Placeholder job_id baked into every exported workflow's string node
+KNOWN_JOB_ID = "e44054af-f0ce-4413-8b37-853e1cc680aa"
+
+STORY_PAGE_NODES = {
+    "images": ("12", "13", "14"),
+    "name": "46",
+    "seed": "1",
+    "instantid": "4",
+    "controlnet": "6",
+}
+
+COVERPAGE_NODES = {
+    "images": ("91", "92", "93"),
+    "name": "95",
+    "cover_image": "6",
+}
+
+
+# Helper function to validate workflow files
+def load_workflow(file_path):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Workflow file not found: {file_path}")
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return data
+        elif isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
+            return data[0]
+        elif not isinstance(data, list):
+            raise ValueError("Workflow must be a dictionary or list.")
+        return data
+
+    except json.JSONDecodeError as e:
+        raise ValueError(
+            f"Invalid JSON in workflow file: {file_path}. Error: {str(e)}")
+
+
+def find_job_id_node(workflow_data: dict, known_job_id: str) -> str | None:
+    for node_id, node_data in workflow_data.items():
+        if isinstance(node_data, dict):
+            inputs = node_data.get("inputs", {})
+            if "strings" in inputs and inputs["strings"] == known_job_id:
+                return node_id
+    return None
+
+
+def story_page_workflow_path(book_id: str, gender: str, page_num: int) -> str:
+    return os.path.join(
+        INPUT_FOLDER, "stories", book_id, gender.lower(), f"pg{page_num}",
+        f"{page_num:02d}_{book_id}_{gender}.json"
+    )
+
+
+def coverpage_workflow_path(book_style: str, book_id: str) -> str:
+    return os.path.join(
+        INPUT_FOLDER, "stories", "coverpage_wide", f"{book_style}_{book_id}.json")
+
+
+# A parsed workflow plus the node ids we patch on every render
+class WorkflowTemplate:
+    def __init__(self, path: str, data: dict, mtime: float, nodes: dict):
+        if isinstance(data, list):
+            data = data[0] if data else {}
+        self.path = path
+        self.data = data
+        self.mtime = mtime
+
+        def injectable(node_id):
+            node = data.get(node_id) if node_id else None
+            return node_id if isinstance(node, dict) and "inputs" in node else None
+
+        self.job_id_node = find_job_id_node(data, KNOWN_JOB_ID)
+        self.image_nodes = [n for n in nodes.get("images", ()) if injectable(n)]
+        self.name_node = injectable(nodes.get("name"))
+        self.seed_node = injectable(nodes.get("seed"))
+        self.instantid_node = injectable(nodes.get("instantid"))
+        self.controlnet_node = injectable(nodes.get("controlnet"))
+        self.cover_image_node = injectable(nodes.get("cover_image"))
+
+        if not self.job_id_node:
+            logger.warning(f"⚠️ No job_id node found in workflow template {path}")
+
+    def render(self, job_id: str, name: str, images: List[str],
+               seed: Optional[int] = None,
+               instantid_file: Optional[str] = None,
+               control_net_name: Optional[str] = None,
+               cover_image: Optional[str] = None) -> dict:
+        # Shallow copy of the graph; only the patched nodes get their own dicts
+        workflow = dict(self.data)
+
+        def patch(node_id, key, value):
+            node = dict(workflow[node_id])
+            node["inputs"] = {**node["inputs"], key: value}
+            workflow[node_id] = node
+
+        if self.instantid_node and instantid_file is not None:
+            patch(self.instantid_node, "instantid_file", instantid_file)
+        if self.controlnet_node and control_net_name is not None:
+            patch(self.controlnet_node, "control_net_name", control_net_name)
+        for node_id, image_path in zip(self.image_nodes, images):
+            patch(node_id, "image", image_path)
+        if self.cover_image_node and cover_image is not None:
+            patch(self.cover_image_node, "image", cover_image)
+        if self.name_node:
+            patch(self.name_node, "value", name)
+        if self.job_id_node:
+            patch(self.job_id_node, "strings", job_id)
+        if self.seed_node and seed is not None:
+            patch(self.seed_node, "seed", seed)
+
+        return workflow
+
+
+# Loads each workflow file once; a changed mtime reloads it
+class WorkflowTemplateRegistry:
+    def __init__(self):
+        self._templates: dict[str, WorkflowTemplate] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, nodes: dict) -> WorkflowTemplate:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Workflow file not found: {path}")
+        mtime = os.path.getmtime(path)
+
+        template = self._templates.get(path)
+        if template is not None and template.mtime == mtime:
+            return template
+
+        with self._lock:
+            template = self._templates.get(path)
+            if template is None or template.mtime != mtime:
+                template = WorkflowTemplate(path, load_workflow(path), mtime, nodes)
+                self._templates[path] = template
+                logger.info(f"🧩 Compiled workflow template {path}")
+        return template
+
+    def story_page(self, book_id: str, gender: str, page_num: int) -> WorkflowTemplate:
+        return self.get(story_page_workflow_path(book_id, gender, page_num), STORY_PAGE_NODES)
+
+    def coverpage(self, book_style: str, book_id: str) -> WorkflowTemplate:
+        return self.get(coverpage_workflow_path(book_style, book_id), COVERPAGE_NODES)
+
+
+workflow_templates = WorkflowTemplateRegistry()
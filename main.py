@@ -1,14 +1,29 @@
 import boto3
 import re
 from helper.prepare_cover_inputs_from_selected_slides import prepare_cover_inputs_from_selected_indices
-from helper.pdf_generator import create_interior_pdf
+from helper.pdf_generator import PRINT_READY_DIR, create_interior_pdf, prerender_print_page
 from helper.random_seed import generate_random_seed
+from helper.workflow_templates import workflow_templates
+from helper.image_workers import convert_png_to_jpg, image_workers
+from helper.story_catalog import story_catalog
 from helper.create_front_cover_pdf import create_front_cover_pdf
+from helper.print_specs import print_specs
+from helper.s3_uploader import S3Uploader
+from helper.email_service import email_service
+from helper.job_events import job_events
+from helper.static_assets import CachedStaticFiles, html_shells
+from helper.conditional import (
+    content_etag, etag_matches, not_modified, set_etag, version_etag, wait_for_version_change
+)
+from helper.comfy_ws import get_ws_session
+from helper.comfy_client import ComfyUIError, get_comfy_client
+from helper.comfy_pool import ComfyPool, configured_comfy_servers
+from helper.job_queue import (
+    GpuJobQueue, GpuScheduler, PRIORITY_COVER, PRIORITY_PAID, PRIORITY_REGENERATE
+)
 from email.message import EmailMessage
-import smtplib
 from pydantic import BaseModel, EmailStr
 import logging
-import base64
 import datetime
 import io
 import os
@@ -17,19 +32,17 @@ from typing import List, Optional
 import uuid
 import json
 import asyncio
-import websocket
-import urllib.request
 import urllib.parse
 from PIL import Image
-from fastapi import FastAPI, File, Form, Request, UploadFile, Query, HTTPException, BackgroundTasks, APIRouter, Body, status
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, File, Form, Request, Response, UploadFile, Query, HTTPException, BackgroundTasks, APIRouter, Body, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 import shutil
 from threading import Thread
-from database import save_user_details, user_details_collection
+from database import ensure_indexes, next_order_id, user_details_collection, gpu_jobs_collection
+from repository import close_async_client, user_details_repo
 from datetime import datetime, timezone
 from models import ItemShippedPayload, BookStylePayload
 from pathlib import Path
@@ -43,19 +56,15 @@ from paypalcheckoutsdk.orders import OrdersCreateRequest, OrdersCaptureRequest
 from helper.paypal_utils import get_paypal_access_token
 from pydantic import BaseModel, Field
 from typing import Optional
-from concurrent.futures import ProcessPoolExecutor
 from html import escape
 from email.header import Header
 
 load_dotenv(dotenv_path=".env")
-executor = ProcessPoolExecutor(max_workers=2) 
 
-SERVER_ADDRESS = os.getenv("SERVER_ADDRESS")
+COMFYUI_PROMPT_TIMEOUT = float(os.getenv("COMFYUI_PROMPT_TIMEOUT", "1800"))
 INPUT_FOLDER = os.path.normpath(os.getenv("INPUT_FOLDER"))
 OUTPUT_FOLDER = os.path.normpath(os.getenv("OUTPUT_FOLDER"))
-JPG_OUTPUT = os.path.normpath(os.getenv("JPG_OUTPUT"))
 WATERMARK_PATH = os.path.normpath(os.getenv("WATERMARK_PATH"))
-STORIES_FOLDER = os.path.normpath(os.getenv("STORIES_FOLDER"))
 IP_ADAPTER = os.getenv("IP_ADAPTER")
 PYTORCH_MODEL = os.getenv("PYTORCH_MODEL")
 EMAIL_USER = os.getenv("EMAIL_USER")
@@ -80,6 +89,7 @@ s3 = boto3.client(
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
     region_name=os.getenv("AWS_REGION")
 )
+s3_uploader = S3Uploader(s3)
 
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s [%(levelname)s] %(message)s")
@@ -109,12 +119,60 @@ if not EMAIL_USER or not EMAIL_PASS:
     raise RuntimeError(
         "Missing EMAIL_USER or EMAIL_PASS environment variables")
 
+def update_job_workflow_status(job: dict, status: str):
+    if job.get("kind") == "coverpage":
+        # covers have no workflow key; their retry/failure lands on the order itself
+        user_details_collection.update_one(
+            {"job_id": job["job_id"]},
+            {"$set": {"cover_status": status, "updated_at": datetime.now(timezone.utc)}}
+        )
+        return
+    if job.get("workflow_key"):
+        user_details_collection.update_one(
+            {"job_id": job["job_id"]},
+            {"$set": {f"workflows.{job['workflow_key']}.status": status}, "$inc": {"version": 1}}
+        )
+        job_events.publish(job["job_id"], "workflow", {
+            "workflow": job["workflow_key"].replace("workflow_", ""),
+            "status": status,
+        })
+
+comfy_pool = ComfyPool(configured_comfy_servers())
+
+gpu_scheduler = GpuScheduler(
+    GpuJobQueue(gpu_jobs_collection),
+    comfy_pool,
+    status_callback=update_job_workflow_status
+)
+
+@app.on_event("startup")
+async def start_gpu_scheduler():
+    job_events.bind(asyncio.get_running_loop())
+    # a malformed print-spec table should stop the deploy, not a cover job after approval
+    await asyncio.to_thread(print_specs.load)
+    await asyncio.to_thread(ensure_indexes)
+    await story_catalog.start()
+    await comfy_pool.start()
+    await gpu_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_gpu_scheduler():
+    await gpu_scheduler.stop()
+    await story_catalog.stop()
+    await comfy_pool.stop()
+    await asyncio.to_thread(image_workers.shutdown)
+    await asyncio.to_thread(s3_uploader.shutdown)
+    await asyncio.to_thread(email_service.shutdown)
+    await close_async_client()
+
 @app.middleware("http")
 async def add_no_cache_headers(request: Request, call_next):
     response = await call_next(request)
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
+    # Static assets and routes that validate with ETags set their own Cache-Control
+    if "cache-control" not in response.headers:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = "0"
     return response
 
 class ApproveRequest(BaseModel):
@@ -257,66 +315,16 @@ async def verify_signature(request: Request, background_tasks: BackgroundTasks):
             "phone": payer_contact
         }
 
-        # Step 3: Generate new order_id with robust incrementing logic
+        # Step 3: Take the next order_id from the per-prefix counter (atomic, no scan)
         try:
-            # Define order ID patterns and defaults
-            order_patterns = {
-                "TEST": {
-                    "regex": r"^TEST#(\d+)$",
-                    "default": "TEST#0",
-                    "prefix": "TEST#"
-                },
-                "COLLAB": {
-                    "regex": r"^COLLAB#(\d+)$",
-                    "default": "COLLAB#0",
-                    "prefix": "COLLAB#"
-                },
-                "DEFAULT": {
-                    "regex": r"^#(\d+)$",
-                    "default": "#1199",
-                    "prefix": "#"
-                }
-            }
-
-            # Determine which pattern to use
-            pattern_key = "DEFAULT"
-            if discount_code == "TEST":
-                pattern_key = "TEST"
-            elif discount_code == "COLLAB":
-                pattern_key = "COLLAB"
-
-            pattern = order_patterns[pattern_key]
-            logger.info(f"🎟️ Using order ID pattern: {pattern_key}")
-
-            # Find the highest existing order number for this pattern
-            pipeline = [
-                {"$match": {"order_id": {"$regex": pattern['regex']}}},
-                {"$project": {
-                    "order_num": {
-                        "$toInt": {
-                            "$arrayElemAt": [
-                                {"$split": ["$order_id", "#"]},
-                                1
-                            ]
-                        }
-                    }
-                }},
-                {"$sort": {"order_num": -1}},
-                {"$limit": 1}
-            ]
-
-            result = list(user_details_collection.aggregate(pipeline))
-            highest_num = result[0]["order_num"] if result else int(pattern['default'].split("#")[1])
-            new_num = highest_num + 1
-            new_order_id = f"{pattern['prefix']}{new_num}"
-
-            logger.info(f"🔢 Generated new order ID: {new_order_id} (Previous highest: {highest_num})")
+            new_order_id = await asyncio.to_thread(next_order_id, discount_code)
+            logger.info(f"🔢 Generated new order ID: {new_order_id}")
 
         except Exception as e:
             logger.exception(f"❌ Failed to generate order_id: {str(e)}")
             return {"success": False, "error": "Failed to generate order ID"}
 
-        user = user_details_collection.find_one({"job_id": job_id})
+        user = await user_details_repo.get(job_id)
         if not user:
             logger.error(f"❌ No user found for job_id={job_id}")
             return {"success": False, "error": "Job ID not found"}
@@ -342,8 +350,8 @@ async def verify_signature(request: Request, background_tasks: BackgroundTasks):
             "updated_at": datetime.now(timezone.utc)
         }
 
-        user_details_collection.update_one(
-            {"job_id": job_id},
+        await user_details_repo.update(
+            job_id,
             {"$set": update_data}
         )
 
@@ -408,7 +416,7 @@ async def save_user_details_endpoint(request: SaveUserDetailsRequest):
         data["paid"] = False
         data["approved"] = False
 
-        save_user_details(data)
+        await user_details_repo.save(data)
 
         return {
             "preview_url": data["preview_url"],
@@ -423,7 +431,7 @@ async def save_user_details_endpoint(request: SaveUserDetailsRequest):
 
 @app.get("/api/order-status/{job_id}")
 async def get_order_status(job_id: str):
-    order = user_details_collection.find_one({"job_id": job_id})
+    order = await user_details_repo.get(job_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
@@ -450,8 +458,8 @@ async def mark_purchase_fired(data: dict):
     if not job_id:
         raise HTTPException(status_code=400, detail="Missing job_id")
 
-    result = user_details_collection.update_one(
-        {"job_id": job_id},
+    result = await user_details_repo.update(
+        job_id,
         {"$set": {"dlv_purchase_event_fired": True}}
     )
 
@@ -526,8 +534,8 @@ async def shopify_webhook(request: Request):
         }
 
         if request_id:
-            result = user_details_collection.update_one(
-                {"job_id": request_id},
+            result = await user_details_repo.update(
+                request_id,
                 {"$set": {
                     "paid": True,
                     "order_id": order_id,
@@ -543,7 +551,7 @@ async def shopify_webhook(request: Request):
                 f"💰 Updated paid status for {request_id}: matched={result.matched_count}, modified={result.modified_count}")
             print(f"✅ Shopify Email stored: {customer_email}")
 
-            record = user_details_collection.find_one({"job_id": request_id})
+            record = await user_details_repo.get(request_id)
             preview_url = record.get("preview_url") if record else None
             name = record.get("name") if record else None
 
@@ -597,15 +605,15 @@ async def capture_order(order_id: str):
         }
 
         # Find user by order_id
-        user_record = user_details_collection.find_one({"order_id": order_id})
+        user_record = await user_details_repo.get_by_order_id(order_id)
         if not user_record:
             logger.warning("No matching user found for order_id=%s", order_id)
             raise HTTPException(status_code=404, detail="User not found")
 
         job_id = user_record.get("job_id")
 
-        user_details_collection.update_one(
-            {"job_id": job_id},
+        await user_details_repo.update(
+            job_id,
             {"$set": {
                 "paid": True,
                 "order_id": order_id,
@@ -732,8 +740,8 @@ async def create_order(request: Request):
         print("Order Data: ", order_data)
 
         # Save to DB
-        user_details_collection.update_one(
-            {"job_id": request_id},
+        await user_details_repo.update(
+            request_id,
             {
                 "$set": {
                     "order_id": order_data["id"],
@@ -797,7 +805,7 @@ async def fetch_and_store_capture(request: Request, background_tasks: Background
         }
 
         # Step 5: Find user and resolve discount code
-        user = user_details_collection.find_one({"job_id": job_id})
+        user = await user_details_repo.get(job_id)
         if not user:
             logger.error(f"❌ No user found for job_id={job_id}")
             raise HTTPException(status_code=404, detail="User not found")
@@ -805,40 +813,9 @@ async def fetch_and_store_capture(request: Request, background_tasks: Background
         discount_code = (user.get("discount_code") or "").upper()
         logger.info(f"🎟️ Using discount_code='{discount_code}' for job_id={job_id}")
 
-        # Step 6: Generate new order_id based on discount_code
+        # Step 6: Take the next order_id for this discount_code's prefix
         try:
-            order_patterns = {
-                "TEST": {"regex": r"^TEST#(\d+)$", "prefix": "TEST#", "default": "TEST#0"},
-                "COLLAB": {"regex": r"^COLLAB#(\d+)$", "prefix": "COLLAB#", "default": "COLLAB#0"},
-                "DEFAULT": {"regex": r"^#(\d+)$", "prefix": "#", "default": "#1199"}
-            }
-
-            pattern_key = "DEFAULT"
-            if discount_code == "TEST":
-                pattern_key = "TEST"
-            elif discount_code == "COLLAB":
-                pattern_key = "COLLAB"
-
-            pattern = order_patterns[pattern_key]
-            logger.info(f"🔢 Generating order_id using pattern: {pattern_key}")
-
-            pipeline = [
-                {"$match": {"order_id": {"$regex": pattern["regex"]}}},
-                {"$project": {
-                    "order_num": {
-                        "$toInt": {
-                            "$arrayElemAt": [{"$split": ["$order_id", "#"]}, 1]
-                        }
-                    }
-                }},
-                {"$sort": {"order_num": -1}},
-                {"$limit": 1}
-            ]
-
-            result = list(user_details_collection.aggregate(pipeline))
-            highest_num = result[0]["order_num"] if result else int(pattern["default"].split("#")[1])
-            new_order_id = f"{pattern['prefix']}{highest_num + 1}"
-
+            new_order_id = await asyncio.to_thread(next_order_id, discount_code)
             logger.info(f"✅ Generated new_order_id: {new_order_id}")
 
         except Exception as e:
@@ -861,7 +838,7 @@ async def fetch_and_store_capture(request: Request, background_tasks: Background
             "discount_code": discount_code
         }
 
-        user_details_collection.update_one({"job_id": job_id}, {"$set": update_data})
+        await user_details_repo.update(job_id, {"$set": update_data})
         logger.info(f"📝 Updated MongoDB for job_id={job_id}")
 
         # Step 8: Send confirmation email (locked preview)
@@ -911,26 +888,25 @@ async def update_preview_url(
             detail="Invalid or empty preview URL"
         )
 
-    existing_job = user_details_collection.find_one({"job_id": job_id})
-    if not existing_job:
+    if not await user_details_repo.exists(job_id):
         print("⚠️ No matching job_id found in DB")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Job ID not found"
         )
 
-    result = user_details_collection.update_one(
-        {"job_id": job_id},
+    result = await user_details_repo.update(
+        job_id,
         {"$set": {"preview_url": preview_url.strip()}}
     )
 
     return {"message": "Preview URL updated successfully"}
 
 @app.get("/get-job-status/{job_id}")
-async def get_job_status(job_id: str):
+async def get_job_status(job_id: str, request: Request, response: Response):
     try:
-        user_details = user_details_collection.find_one(
-            {"job_id": job_id},
+        user_details = await user_details_repo.get(
+            job_id,
             {
                 "_id": 0,
                 "paid": 1,
@@ -946,20 +922,27 @@ async def get_job_status(job_id: str):
         )
         if not user_details:
             raise HTTPException(status_code=404, detail="Job ID not found.")
+        etag = content_etag(user_details)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         return user_details
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to retrieve job status: {str(e)}")
 
 @app.get("/get-user-details/{job_id}")
-async def get_user_details(job_id: str):
+async def get_user_details(job_id: str, request: Request, response: Response):
 
     try:
-        user_details = user_details_collection.find_one(
-            {"job_id": job_id}, {"_id": 0})
+        user_details = await user_details_repo.get(job_id, {"_id": 0})
         if not user_details:
             raise HTTPException(
                 status_code=404, detail="User details not found.")
+        etag = content_etag(user_details)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         return user_details
     except Exception as e:
         raise HTTPException(
@@ -974,8 +957,8 @@ async def update_book_style(payload: BookStylePayload):
         if book_style not in ["hardcover", "paperback"]:
             raise HTTPException(status_code=400, detail="Invalid book style")
 
-        result = user_details_collection.update_one(
-            {"job_id": job_id},
+        result = await user_details_repo.update(
+            job_id,
             {"$set": {"book_style": book_style}}
         )
 
@@ -989,86 +972,17 @@ async def update_book_style(payload: BookStylePayload):
         raise HTTPException(
             status_code=500, detail="Failed to update book style")
 
-# Helper function to validate workflow files
-def load_workflow(file_path):
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Workflow file not found: {file_path}")
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, dict):
-            return data
-        elif isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
-            return data[0]
-        elif not isinstance(data, list):
-            raise ValueError("Workflow must be a dictionary or list.")
-        return data
-
-    except json.JSONDecodeError as e:
-        raise ValueError(
-            f"Invalid JSON in workflow file: {file_path}. Error: {str(e)}")
-
 # Function to queue a prompt
-def queue_prompt(prompt, client_id):
-    payload = {"prompt": prompt, "client_id": client_id}
-    data = json.dumps(payload).encode('utf-8')
-
-    try:
-        req = urllib.request.Request(
-            f"http://{SERVER_ADDRESS}/prompt", data=data)
-        response = urllib.request.urlopen(req)
-        return json.loads(response.read())
-    except Exception as e:
-        print(f"ComfyUI API Error: {e}")
-        raise HTTPException(
-            status_code=400, detail=f"ComfyUI API Error: {str(e)}")
+async def queue_prompt(prompt, client_id, server_address):
+    return await get_comfy_client(server_address).queue_prompt(prompt, client_id)
 
 # Function to get an image from the server
-def get_image(filename, subfolder, folder_type):
-    params = {"filename": filename,
-              "subfolder": subfolder, "type": folder_type}
-    url_values = urllib.parse.urlencode(params)
-    with urllib.request.urlopen(f"http://{SERVER_ADDRESS}/view?{url_values}") as response:
-        return response.read()
+async def get_image(filename, subfolder, folder_type, server_address):
+    return await get_comfy_client(server_address).get_image(filename, subfolder, folder_type)
 
 # Function to get history of a prompt execution
-def get_history(prompt_id):
-    with urllib.request.urlopen(f"http://{SERVER_ADDRESS}/history/{prompt_id}") as response:
-        return json.loads(response.read())
-
-# Function to convert PNG to JPG
-def convert_png_to_jpg(png_data, output_path, watermark_path):
-    try:
-        img = Image.open(io.BytesIO(png_data))
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-
-        original_width, original_height = img.size
-        new_height = 720
-        new_width = int((original_width / original_height) * new_height)
-        img = img.resize((new_width, new_height))
-
-        watermark = Image.open(watermark_path).convert("RGBA")
-
-        watermark_size = (int(new_width * 0.5), int(new_height * 0.5))
-        watermark = watermark.resize(watermark_size)
-
-        r, g, b, a = watermark.split()
-        a = a.point(lambda x: x * 0.2)
-        watermark = Image.merge('RGBA', (r, g, b, a))
-
-        position = (
-            (img.width - watermark.width) // 2,
-            (img.height - watermark.height) // 2
-        )
-
-        img = img.convert("RGBA")
-        img.paste(watermark, position, watermark)
-        img = img.convert("RGB")
-        img.save(output_path, format="JPEG", quality=90)
-
-    except Exception as e:
-        raise ValueError(f"Error converting PNG to JPG: {str(e)}")
+async def get_history(prompt_id, server_address):
+    return await get_comfy_client(server_address).get_history(prompt_id)
 
 # Function to get images after execution
 def copy_interiors_for_print(job_id: str, selected: list[int]) -> str:
@@ -1103,7 +1017,81 @@ def copy_interiors_for_print(job_id: str, selected: list[int]) -> str:
 
     return approved_dir
 
-def get_images(ws, prompt, job_id, workflow_number, client_id):
+def save_interior_png(image_data, job_id, png_filename):
+    # Approval and print builds read the full-resolution PNG from output/{job_id}/interior
+    local_interior_dir = os.path.join(OUTPUT_FOLDER, job_id, "interior")
+    os.makedirs(local_interior_dir, exist_ok=True)
+
+    # Use original filename → do NOT add timestamp
+    png_path = os.path.join(local_interior_dir, os.path.basename(png_filename))
+    with open(png_path, "wb") as f:
+        f.write(image_data)
+    logger.info(f"🖼️ Saved PNG to local interior: {png_path}")
+    return png_path
+
+async def save_and_upload_image(image_data, job_id, png_filename, jpg_filename, prerender=False):
+    png_path = await asyncio.to_thread(save_interior_png, image_data, job_id, png_filename)
+
+    # Preview JPG is encoded in a worker process and streamed straight to S3
+    jpg_data = await image_workers.run(convert_png_to_jpg, image_data, WATERMARK_PATH)
+    s3_key = f"{S3_JPG_PREFIX}/{jpg_filename}"
+    await s3_uploader.upload_bytes_async(
+        jpg_data, S3_DIFFRUN_GENERATIONS, s3_key, content_type="image/jpeg")
+
+    if prerender:
+        # 300-DPI print page renders in the background so approval only stitches;
+        # this only queues (or skips when the pool is busy), it never waits
+        prerender_print_page(png_path, os.path.join(OUTPUT_FOLDER, job_id, PRINT_READY_DIR))
+
+    return f"https://{S3_DIFFRUN_GENERATIONS}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_key}"
+
+def record_job_images(job_id, workflow_id, entries):
+    # Jobs created before the manifest existed have no image_manifest and stay on S3 listing
+    user_details_collection.update_one(
+        {"job_id": job_id, "image_manifest": {"$exists": True}},
+        {"$push": {f"image_manifest.{workflow_id}": {"$each": entries}},
+         "$inc": {"version": 1}}
+    )
+
+def list_job_images(job_id, user_details, normalize=False):
+    """Preview images per workflow id, from the job's manifest or (legacy jobs) S3."""
+    manifest = user_details.get("image_manifest")
+    if manifest is not None:
+        return {workflow_id: list(images) for workflow_id, images in manifest.items()}
+
+    workflow_groups = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for response in paginator.paginate(
+            Bucket=S3_DIFFRUN_GENERATIONS, Prefix=f"{S3_JPG_PREFIX}/{job_id}_"):
+        for obj in response.get("Contents", []):
+            key = obj["Key"]
+            file = os.path.basename(key)
+
+            if (
+                not file.startswith(job_id)
+                or not file.lower().endswith(".jpg")
+                or "collage" in file.lower()
+            ):
+                continue
+
+            match = re.match(
+                rf"{re.escape(job_id)}_(pg\d+|\d+)_\d+_\d+\.jpg", file)
+            if not match:
+                continue
+
+            workflow_id = match.group(1)
+            if normalize:
+                digits = re.sub(r"\D", "", workflow_id)
+                workflow_id = f"pg{int(digits)}"
+
+            image_url = f"https://{S3_DIFFRUN_GENERATIONS}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{key}"
+            workflow_groups.setdefault(workflow_id, []).append({
+                "filename": file,
+                "url": image_url
+            })
+    return workflow_groups
+
+async def get_images(prompt, job_id, workflow_number, server_address=None):
     logger.info(f"🧲 get_images() started for workflow {workflow_number}")
 
     try:
@@ -1117,31 +1105,60 @@ def get_images(ws, prompt, job_id, workflow_number, client_id):
     except Exception:
         workflow_id_str = workflow_number
 
-    prompt_id = queue_prompt(prompt, client_id)["prompt_id"]
-    output_images = {}
-    image_index = 1
-
-    logger.info(f"📡 Queued prompt {prompt_id} for workflow {workflow_id_str}")
-
-    while True:
-        logger.debug(
-            f"🛰️ Waiting for WebSocket message for workflow {workflow_id_str}")
-        out = ws.recv()
-
-        if isinstance(out, str):
-            message = json.loads(out)
-            if message['type'] == 'executing':
-                data = message['data']
-                if data['node'] is None and data['prompt_id'] == prompt_id:
-                    logger.info(
-                        f"🔚 Execution complete for workflow {workflow_id_str}, prompt_id={prompt_id}")
-                    break
-        else:
-            logger.warning(
-                f"⚠️ Received non-string WebSocket message for workflow {workflow_id_str}")
+    # 📡 Queue on the assigned node; fail over to another healthy one if it stops answering
+    assigned = comfy_pool.get(server_address) if server_address else None
+    node = assigned or comfy_pool.pick()
+    holder = assigned  # node currently counting this prompt against its in-flight cap
+    tried = []
+    try:
+        while True:
+            if node is None:
+                raise HTTPException(
+                    status_code=503, detail="No healthy ComfyUI node available")
+            tried.append(node.address)
+            try:
+                # Shared per-process socket; events are routed back to us by prompt_id
+                ws_session = await asyncio.to_thread(get_ws_session, node.address)
+                # read before queueing: a reconnect after this point is re-checked in wait_for
+                queued_generation = ws_session.generation
+                prompt_id = (await queue_prompt(
+                    prompt, ws_session.client_id, node.address))["prompt_id"]
+                comfy_pool.mark_success(node)
+                break
+            except ComfyUIError as e:
+                print(f"ComfyUI API Error: {e}")
+                if not e.retryable:
+                    raise HTTPException(
+                        status_code=400, detail=f"ComfyUI API Error: {str(e)}")
+                comfy_pool.mark_failure(node, str(e))
+                node = comfy_pool.pick(exclude=tuple(tried))
+                logger.warning(f"🔀 Failing over workflow {workflow_id_str} to {node.address if node else 'nothing'}")
+                if holder is not None and node is not None:
+                    # the scheduler's slot follows the prompt to the node now running it
+                    comfy_pool.transfer(holder, node)
+                    holder = node
+
+        server_address = node.address
+        output_images = {}
+        image_index = 1
+
+        logger.info(f"📡 Queued prompt {prompt_id} on {server_address} for workflow {workflow_id_str}")
+
+        try:
+            await asyncio.wait_for(
+                asyncio.wrap_future(ws_session.wait_for(prompt_id, queued_generation)),
+                timeout=COMFYUI_PROMPT_TIMEOUT)
+        finally:
+            ws_session.discard(prompt_id)
+    finally:
+        # hand the slot back so the scheduler releases the node it acquired
+        if holder is not None:
+            comfy_pool.transfer(holder, assigned)
+    logger.info(
+        f"🔚 Execution complete for workflow {workflow_id_str}, prompt_id={prompt_id}")
 
     try:
-        history = get_history(prompt_id)[prompt_id]
+        history = (await get_history(prompt_id, server_address))[prompt_id]
     except Exception as e:
         logger.error(f"❌ Failed to get execution history: {str(e)}")
         raise HTTPException(
@@ -1149,9 +1166,11 @@ def get_images(ws, prompt, job_id, workflow_number, client_id):
 
     logger.info(f"📜 Retrieved execution history for prompt {prompt_id}")
 
+    # Each image's convert + upload runs as its own task while the next one downloads
+    pending = []
+    # pg0 (and the coverpage workflow, which parses to pg0) never goes into the interior PDF
+    prerender = workflow_id_str != "pg0"
     for node_id, node_output in history['outputs'].items():
-        images_output = []
-
         if 'images' not in node_output:
             continue
 
@@ -1160,66 +1179,40 @@ def get_images(ws, prompt, job_id, workflow_number, client_id):
                 f"🖼️ Found image: {image['filename']} (type: {image['type']})")
 
             try:
-                image_data = get_image(
-                    image['filename'], image['subfolder'], image['type'])
+                image_data = await get_image(
+                    image['filename'], image['subfolder'], image['type'], server_address)
             except Exception as e:
                 logger.error(f"❌ Failed to fetch image: {str(e)}")
                 continue
 
             timestamp = int(datetime.now(timezone.utc).timestamp() * 1000)
             jpg_filename = f"{job_id}_{workflow_id_str}_{timestamp}_{image_index:03d}.jpg"
-            jpg_path = os.path.join(JPG_OUTPUT, jpg_filename)
-
-            try:
-                # Step 1 → Save PNG to output/{job_id}/interior
-                local_interior_dir = os.path.join(
-                    OUTPUT_FOLDER, job_id, "interior")
-                os.makedirs(local_interior_dir, exist_ok=True)
-
-                # Use original filename → do NOT add timestamp
-                png_filename_clean = os.path.basename(image['filename'])
-                png_path = os.path.join(local_interior_dir, png_filename_clean)
-
-                # Save PNG
-                with open(png_path, "wb") as f:
-                    f.write(image_data)
-                logger.info(f"🖼️ Saved PNG to local interior: {png_path}")
-
-                # Step 2 → Convert PNG to JPG for frontend
-                convert_png_to_jpg(image_data, jpg_path, WATERMARK_PATH)
-                logger.info(f"🖼️ Saved JPG to JPG_OUTPUT: {jpg_path}")
-            except Exception as e:
-                logger.error(f"❌ Conversion failed: {e}")
-                continue
-
-            if not os.path.exists(jpg_path):
-                logger.error(f"❌ JPG missing: {jpg_path}")
-                continue
 
-            try:
-                s3_key = f"{S3_JPG_PREFIX}/{jpg_filename}"
-                s3.upload_file(jpg_path, S3_DIFFRUN_GENERATIONS, s3_key)
-                logger.info(
-                    f"📤 Uploaded to S3: s3://{S3_DIFFRUN_GENERATIONS}/{s3_key}")
-            except Exception as e:
-                logger.error(f"❌ Failed to upload {jpg_filename} to S3: {e}")
-                continue
+            pending.append((node_id, jpg_filename, asyncio.create_task(save_and_upload_image(
+                image_data, job_id, image['filename'], jpg_filename, prerender))))
+            image_index += 1
 
-            try:
-                with open(jpg_path, "rb") as f:
-                    jpg_data = f.read()
-                img_str = base64.b64encode(jpg_data).decode("utf-8")
-                images_output.append(f"data:image/jpeg;base64,{img_str}")
-            except Exception as e:
-                logger.error(f"❌ Could not read JPG: {e}")
-                continue
+        output_images.setdefault(node_id, [])
 
-            image_index += 1
+    manifest_entries = []
+    for node_id, jpg_filename, task in pending:
+        try:
+            image_url = await task
+        except Exception as e:
+            logger.error(f"❌ Failed to process {jpg_filename}: {e}")
+            continue
+        output_images[node_id].append(image_url)
+        manifest_entries.append({"filename": jpg_filename, "url": image_url})
 
-        output_images[node_id] = images_output
+    if manifest_entries:
+        try:
+            await asyncio.to_thread(
+                record_job_images, job_id, workflow_id_str, manifest_entries)
+        except Exception as e:
+            logger.error(f"❌ Failed to record image manifest for {job_id}/{workflow_id_str}: {e}")
 
     logger.info(
-        f"📸 Done saving and uploading {image_index - 1} image(s) for workflow {workflow_id_str}")
+        f"📸 Done saving and uploading {len(manifest_entries)} image(s) for workflow {workflow_id_str}")
     return output_images
 
 @app.post("/store-user-details")
@@ -1308,12 +1301,14 @@ async def store_user_details(
         "book_id": book_id,
         "paid": False,
         "approved": False,
+        # get_images appends every preview here; /poll-images reads it instead of listing S3
+        "image_manifest": {},
         "created_at": datetime.now(timezone.utc), 
         "updated_at": datetime.now(timezone.utc)
     }
 
     try:
-        save_user_details(response)
+        await user_details_repo.save(response)
     except Exception as e:
         logger.error("❌ Could not save user details to MongoDB: %s", str(e))
         raise HTTPException(
@@ -1325,51 +1320,10 @@ async def store_user_details(
     return response
 
 def get_sorted_workflow_files(book_id: str, gender: str) -> List[tuple[int, str]]:
-    base_dir = os.path.join(
-        STORIES_FOLDER,
-        book_id, gender
-    )
-
-    logger.info(f"📁 Checking base directory: {base_dir}")
-
-    if not os.path.exists(base_dir):
-        logger.error(f"❌ Base folder does not exist: {base_dir}")
-        raise FileNotFoundError(f"Base folder not found: {base_dir}")
-
-    page_dirs = []
-    entries = os.listdir(base_dir)
-    logger.debug(f"📂 Found {len(entries)} entries in {base_dir}: {entries}")
-
-    for entry in entries:
-        full_path = os.path.join(base_dir, entry)
-        match = re.match(r'pg(\d+)', entry)
-        if match and os.path.isdir(full_path):
-            page_num = int(match.group(1))
-            logger.debug(
-                f"✅ Valid page directory found: {entry} (page {page_num})")
-            page_dirs.append((page_num, entry))
-        else:
-            logger.debug(
-                f"⏭️ Ignoring non-pgX or non-directory entry: {entry}")
-
-    sorted_pages = sorted(page_dirs, key=lambda x: x[0])
+    # 📚 Served from the in-memory story catalog; no directory scan per request
+    workflow_files = story_catalog.workflows(book_id, gender)
     logger.info(
-        f"🔢 Sorted page folders: {[f'pg{num}' for num, _ in sorted_pages]}")
-
-    workflow_files = []
-    for page_num, folder_name in sorted_pages:
-        padded_page = f"{page_num:02d}"
-        expected_file = f"{padded_page}_{book_id}_{gender}.json"
-        workflow_path = os.path.abspath(
-            os.path.join(base_dir, folder_name, expected_file))
-
-        if os.path.exists(workflow_path):
-            logger.info(f"📄 Workflow file found: {workflow_path}")
-            workflow_files.append((page_num, expected_file))
-        else:
-            logger.warning(f"⚠️ Workflow file missing: {workflow_path}")
-
-    logger.info(f"✅ Total valid workflows detected: {len(workflow_files)}")
+        f"✅ {len(workflow_files)} workflows for {book_id}/{gender}: {[f'pg{num}' for num, _ in workflow_files]}")
     return workflow_files
 
 @app.post("/approve")
@@ -1402,10 +1356,12 @@ def process_approval_workflow(job_id: str, selectedSlides: str):
             page = str(i + 1).zfill(2)
             variant = str(variant_index + 1).zfill(5)
             pattern = f"*_{page}_{variant}*.png"
-            logger.info(f"🔍 Looking for pattern: {pattern} in {source_dir}")
-            matches = list(source_dir.glob(pattern))
+            # ComfyUI names pages _{job_id}_{page}_{variant}_.png; only glob for odd names
+            exact = source_dir / f"_{job_id}_{page}_{variant}_.png"
+            matches = [exact] if exact.exists() else list(source_dir.glob(pattern))
             if matches:
-                shutil.copy(matches[0], approved_dir / matches[0].name)
+                # copy2 keeps the mtime so the print_ready cache still counts as fresh
+                shutil.copy2(matches[0], approved_dir / matches[0].name)
                 logger.info(f"✅ Copied: {matches[0]}")
             else:
                 logger.warning(f"❌ No match for {pattern} in {source_dir}")
@@ -1419,13 +1375,14 @@ def process_approval_workflow(job_id: str, selectedSlides: str):
             source_folder=str(approved_dir),
             output_pdf=interior_pdf_path,
             selectedSlides=interior_selected,
-            job_id=job_id
+            job_id=job_id,
+            cache_folder=str(Path(OUTPUT_FOLDER) / job_id / PRINT_READY_DIR)
         )
 
         pdf_filename = f"{job_id}_interior.pdf"
         s3_key = f"{job_id}/{pdf_filename}"
-        s3.upload_file(interior_pdf_path, "storyprints", s3_key)
-        logger.info(f"📤 Uploaded interior PDF to s3://storyprints/{s3_key}")
+        s3_uploader.upload_file(
+            interior_pdf_path, "storyprints", s3_key, content_type="application/pdf")
         interior_url = f"https://storyprints.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_key}"
 
         exterior_index = selected[0]
@@ -1433,6 +1390,8 @@ def process_approval_workflow(job_id: str, selectedSlides: str):
 
         book_id = user.get("book_id")
         book_style = user.get("book_style")
+        # Fail before spending GPU time on a cover we cannot print
+        print_specs.cover(book_style, book_id)
 
         cover_src_pattern = f"*{job_id}_{book_id}_{variant_str}*"
         cover_exterior_dir = Path(OUTPUT_FOLDER) / job_id / "exterior"
@@ -1449,11 +1408,20 @@ def process_approval_workflow(job_id: str, selectedSlides: str):
         cover_input_filename = cover_matches[0].name
         logger.info(f"✅ Copied cover image: {cover_matches[0]} → {cover_dest}")
 
-        run_coverpage_workflow_in_background(
-            job_id=job_id,
-            book_id=book_id,
-            book_style=book_style,
-            cover_input_filename=cover_input_filename
+        # 📚 Print covers jump ahead of preview traffic on the GPU queue; cover_status
+        # tracks the job from here, since approval no longer waits for the cover PDF
+        user_details_collection.update_one(
+            {"job_id": job_id},
+            {"$set": {"cover_status": "queued"}}
+        )
+        gpu_scheduler.submit(
+            "coverpage", job_id,
+            {
+                "book_id": book_id,
+                "book_style": book_style,
+                "cover_input_filename": cover_input_filename,
+            },
+            priority=PRIORITY_COVER
         )
 
         # Check if email was already sent
@@ -1495,31 +1463,21 @@ def process_approval_workflow(job_id: str, selectedSlides: str):
     except Exception as e:
         logger.exception("❌ Approval background task failed")
 
-def find_job_id_node(workflow_data: dict, known_job_id: str) -> str | None:
-    for node_id, node_data in workflow_data.items():
-        if isinstance(node_data, dict):
-            inputs = node_data.get("inputs", {})
-            if "strings" in inputs and inputs["strings"] == known_job_id:
-                logger.info(f"🔍 Found job_id node: {node_id}")
-                return node_id
-    logger.warning("⚠️ No job_id node found matching known_job_id")
-    return None
-
-def run_workflow_in_background(
+async def run_story_page_workflow(
     job_id: str,
     name: str,
     gender: str,
     saved_filenames: List[str],
     book_id: str,
-    workflow_filename: str
+    workflow_filename: str,
+    lock: bool,
+    server_address: Optional[str] = None
 ):
     name = name.capitalize()
     try:
         logger.info(
             f"🚀 Running workflow {workflow_filename} for job_id={job_id}")
 
-        gender_folder = gender.lower()
-
         # 🔢 Extract pg number from filename like 'pg1.json' or '1.json'
         match = re.match(r'^(?:pg)?(\d+)', workflow_filename)
         if not match:
@@ -1528,328 +1486,112 @@ def run_workflow_in_background(
 
         page_num = int(match.group(1))
         is_preview_workflow = page_num < 10
-        expected_filename = f"{page_num:02d}_{book_id}_{gender}.json"
-
-        workflow_path = os.path.join(
-            INPUT_FOLDER, "stories", book_id, gender_folder, f"pg{page_num}", expected_filename
-        )
 
-        if not os.path.exists(workflow_path):
-            logger.error(f"❌ Workflow file not found: {workflow_path}")
+        try:
+            template = workflow_templates.story_page(book_id, gender, page_num)
+        except FileNotFoundError as e:
+            logger.error(f"❌ {e}")
             raise HTTPException(
                 status_code=404, detail=f"Workflow not found: {workflow_filename}")
 
-        # 🧠 Load and parse workflow
-        workflow_data = load_workflow(workflow_path)
-        if isinstance(workflow_data, list):
-            workflow_data = workflow_data[0] if workflow_data else {}
-
-        allowed_values = workflow_data["4"].get(
-            "inputs", {}).get("instantid_file", [])
-        logger.info(f"📋 Allowed instantid_file values: {allowed_values}")
-        print(IP_ADAPTER, "IP_ADApTER", PYTORCH_MODEL, "pytorchmodel")
-
-        if "4" in workflow_data and "inputs" in workflow_data["4"]:
-            instantid_file_path = IP_ADAPTER
-            print(IP_ADAPTER, "IP_ADAPTER",
-                  instantid_file_path, "instantid_file_path")
-            workflow_data["4"]["inputs"]["instantid_file"] = instantid_file_path
-            logger.info(
-                f"🧠 Injected instantid_file into node 4: {instantid_file_path}")
-
-        if "6" in workflow_data and "inputs" in workflow_data["4"]:
-            control_net_file_path = PYTORCH_MODEL
-            workflow_data["6"]["inputs"]["control_net_name"] = control_net_file_path
-            logger.info(
-                f"🧠 Injected control_net_name into node 6: {control_net_file_path}")
-
-        # 🖼️ Inject images into nodes 12, 13, 14
-        for i, node_id in enumerate(["12", "13", "14"][:len(saved_filenames)]):
-            if node_id in workflow_data and "inputs" in workflow_data[node_id]:
-                workflow_data[node_id]["inputs"]["image"] = os.path.join(
-                    INPUT_FOLDER, saved_filenames[i])
-                logger.info(f"🖼️ Injected image into node {node_id}")
-
-        # ✍️ Inject name into node 46
-        if "46" in workflow_data and "inputs" in workflow_data["46"]:
-            workflow_data["46"]["inputs"]["value"] = name
-            logger.info("📝 Injected name into node 46")
-
-        # 🆔 Inject job_id into string node
-        known_job_id = "e44054af-f0ce-4413-8b37-853e1cc680aa"
-        job_id_node = find_job_id_node(workflow_data, known_job_id)
-        if job_id_node and "inputs" in workflow_data[job_id_node]:
-            workflow_data[job_id_node]["inputs"]["strings"] = job_id
-            logger.info(f"🆔 Replaced job_id in node {job_id_node}")
-        else:
+        # 🧠 Cheap patched copy of the cached template
+        workflow_data = template.render(
+            job_id=job_id,
+            name=name,
+            images=[os.path.join(INPUT_FOLDER, f) for f in saved_filenames],
+            seed=generate_random_seed(),
+            instantid_file=IP_ADAPTER,
+            control_net_name=PYTORCH_MODEL,
+        )
+        if not template.job_id_node:
             logger.warning("⚠️ Could not update job_id — node not found")
 
-        # 🎲 Inject random seed into node 1
-        if "1" in workflow_data and "inputs" in workflow_data["1"]:
-            workflow_data["1"]["inputs"]["seed"] = generate_random_seed()
-            logger.info("🎲 Injected random seed into node 1")
-
-        # 📡 Run via WebSocket
-        client_id = f"{job_id}_workflow_{workflow_filename.replace('.json', '')}"
-        ws = websocket.WebSocket()
-        try:
-            ws.connect(f"ws://{SERVER_ADDRESS}/ws?clientId={client_id}")
-            get_images(ws, workflow_data, job_id,
-                       workflow_filename.replace(".json", ""), client_id)
-        finally:
-            ws.close()
+        # 📡 Run via the shared ComfyUI WebSocket session
+        output_images = await get_images(workflow_data, job_id,
+                                         workflow_filename.replace(".json", ""), server_address)
 
         # ✅ Mark as completed in DB
         workflow_key = f"workflow_pg{page_num}"
-        update_result = user_details_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {f"workflows.{workflow_key}.status": "completed"}}
-        )
-        
+        await user_details_repo.complete_workflow(job_id, workflow_key)
+
         logger.info(f"✅ Updated workflow status for {workflow_key} in DB")
-        
-        # Get the current state of all workflows
-        user = user_details_collection.find_one({"job_id": job_id})
+        job_events.publish(job_id, "workflow", {
+            "workflow": f"pg{page_num}",
+            "status": "completed",
+            "images": [url for urls in output_images.values() for url in urls],
+        })
+
+        # Locked previews only care about pg0–pg9 for the preview email
+        if lock and not is_preview_workflow:
+            logger.info(f"ℹ️ Workflow pg{page_num} completed (not a preview workflow)")
+            return
+
+        # Claim the "preview ready" transition: matches only once pg0–pg9 are all
+        # completed and the email has not been claimed, so one completion wins
+        user = await user_details_repo.claim_preview_ready(
+            job_id, [f"workflow_pg{i}" for i in range(10)],
+            {"preview_url": 1, "email": 1, "name": 1})
         if not user:
-            logger.error(f"❌ User record not found for job_id={job_id}")
+            logger.info("🔄 Preview email not due (pages pending or already sent)")
             return
 
-        workflows = user.get("workflows", {})
-        logger.info(f"📊 Current workflows status: {workflows}")
-
-        # Check if all first 10 workflows are completed AND email hasn't been sent yet
-        all_completed = True
-        for i in range(10):  # Check pg0 to pg9
-            workflow_key = f"workflow_pg{i}"
-            if workflows.get(workflow_key, {}).get("status") != "completed":
-                all_completed = False
-                logger.info(f"⏳ Workflow {workflow_key} not completed yet")
-                break
+        logger.info("🎉 All 10 preview workflows completed!")
+
+        preview_url = user.get("preview_url", "")
+        email = user.get("email")
+
+        if not email or not preview_url:
+            logger.error(f"❌ No {'email' if not email else 'preview_url'} found in user record")
+            await user_details_repo.release_preview_claim(job_id)
+            return
+
+        try:
+            logger.info(f"📧 Preparing to send preview email to {email}")
+            await asyncio.to_thread(
+                preview_email_lock,
+                name=user.get("name", ""),
+                email=email,
+                preview_url=preview_url
+            )
+            logger.info("✅ Preview email sent successfully")
+        except Exception as e:
+            # The page itself rendered fine; a failed send must not reach the GPU
+            # scheduler's retry path. Give the claim back so a later completion retries.
+            logger.error(f"❌ Failed to send preview email: {str(e)}")
+            await user_details_repo.release_preview_claim(job_id)
 
-        if all_completed and not user.get("preview_email_sent", False):
-            logger.info("🎉 All 10 workflows completed and email not sent yet!")
-            
-            preview_url = user.get("preview_url", "")
-            email = user.get("email")
-            
-            if not email:
-                logger.error("❌ No email found in user record")
-                return
-                
-            if not preview_url:
-                logger.error("❌ No preview_url found in user record")
-                return
-                
-            try:
-                logger.info(f"📧 Preparing to send preview email to {email}")
-                preview_email_lock(
-                    name=user.get("name", ""),
-                    email=email,
-                    preview_url=preview_url
-                )
-                logger.info("✅ Preview email sent successfully")
-                
-                # Mark that email was sent to prevent duplicates
-                user_details_collection.update_one(
-                    {"job_id": job_id},
-                    {"$set": {"preview_email_sent": True}}
-                )
-                
-            except Exception as e:
-                logger.error(f"❌ Failed to send preview email: {str(e)}")
-                raise
-                
-        elif all_completed and user.get("preview_email_sent", False):
-            logger.info("ℹ️ All workflows completed but email already sent")
-        else:
-            logger.info("🔄 Not all workflows completed yet")
-            
     except Exception as e:
+        # the GPU scheduler decides between retry and failure and reports the
+        # page status through update_job_workflow_status
         logger.exception(f"🔥 Workflow {workflow_filename} failed for job_id={job_id}: {e}")
-        workflow_key = f"workflow_{workflow_filename.replace('.json', '')}"
-        user_details_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {f"workflows.{workflow_key}.status": "failed"}}
-        )
         raise HTTPException(
             status_code=500, detail=f"Workflow {workflow_filename} failed: {str(e)}")
 
-def run_workflow_in_background_lock(
+async def run_workflow_in_background(
     job_id: str,
     name: str,
     gender: str,
     saved_filenames: List[str],
     book_id: str,
-    workflow_filename: str
+    workflow_filename: str,
+    server_address: Optional[str] = None
 ):
-    name = name.capitalize()
-    try:
-        logger.info(
-            f"🚀 Running workflow {workflow_filename} for job_id={job_id}")
-
-        gender_folder = gender.lower()
-
-        # 🔢 Extract pg number from filename like 'pg1.json' or '1.json'
-        match = re.match(r'^(?:pg)?(\d+)', workflow_filename)
-        if not match:
-            raise HTTPException(
-                status_code=400, detail="Invalid workflow filename format")
-
-        page_num = int(match.group(1))
-        is_preview_workflow = page_num < 10 
-        expected_filename = f"{page_num:02d}_{book_id}_{gender}.json"
+    await run_story_page_workflow(
+        job_id, name, gender, saved_filenames, book_id, workflow_filename,
+        lock=False, server_address=server_address)
 
-        workflow_path = os.path.join(
-            INPUT_FOLDER, "stories", book_id, gender_folder, f"pg{page_num}", expected_filename
-        )
-
-        if not os.path.exists(workflow_path):
-            logger.error(f"❌ Workflow file not found: {workflow_path}")
-            raise HTTPException(
-                status_code=404, detail=f"Workflow not found: {workflow_filename}")
-
-        # 🧠 Load and parse workflow
-        workflow_data = load_workflow(workflow_path)
-        if isinstance(workflow_data, list):
-            workflow_data = workflow_data[0] if workflow_data else {}
-
-        allowed_values = workflow_data["4"].get(
-            "inputs", {}).get("instantid_file", [])
-        logger.info(f"📋 Allowed instantid_file values: {allowed_values}")
-        print(IP_ADAPTER, "IP_ADApTER", PYTORCH_MODEL, "pytorchmodel")
-
-        if "4" in workflow_data and "inputs" in workflow_data["4"]:
-            instantid_file_path = IP_ADAPTER
-            print(IP_ADAPTER, "IP_ADAPTER",
-                  instantid_file_path, "instantid_file_path")
-            workflow_data["4"]["inputs"]["instantid_file"] = instantid_file_path
-            logger.info(
-                f"🧠 Injected instantid_file into node 4: {instantid_file_path}")
-
-        if "6" in workflow_data and "inputs" in workflow_data["4"]:
-            control_net_file_path = PYTORCH_MODEL
-            workflow_data["6"]["inputs"]["control_net_name"] = control_net_file_path
-            logger.info(
-                f"🧠 Injected control_net_name into node 6: {control_net_file_path}")
-
-        # 🖼️ Inject images into nodes 12, 13, 14
-        for i, node_id in enumerate(["12", "13", "14"][:len(saved_filenames)]):
-            if node_id in workflow_data and "inputs" in workflow_data[node_id]:
-                workflow_data[node_id]["inputs"]["image"] = os.path.join(
-                    INPUT_FOLDER, saved_filenames[i])
-                logger.info(f"🖼️ Injected image into node {node_id}")
-
-        # ✍️ Inject name into node 46
-        if "46" in workflow_data and "inputs" in workflow_data["46"]:
-            workflow_data["46"]["inputs"]["value"] = name
-            logger.info("📝 Injected name into node 46")
-
-        # 🆔 Inject job_id into string node
-        known_job_id = "e44054af-f0ce-4413-8b37-853e1cc680aa"
-        job_id_node = find_job_id_node(workflow_data, known_job_id)
-        if job_id_node and "inputs" in workflow_data[job_id_node]:
-            workflow_data[job_id_node]["inputs"]["strings"] = job_id
-            logger.info(f"🆔 Replaced job_id in node {job_id_node}")
-        else:
-            logger.warning("⚠️ Could not update job_id — node not found")
-
-        # 🎲 Inject random seed into node 1
-        if "1" in workflow_data and "inputs" in workflow_data["1"]:
-            workflow_data["1"]["inputs"]["seed"] = generate_random_seed()
-            logger.info("🎲 Injected random seed into node 1")
-
-        # 📡 Run via WebSocket
-        client_id = f"{job_id}_workflow_{workflow_filename.replace('.json', '')}"
-        ws = websocket.WebSocket()
-        try:
-            ws.connect(f"ws://{SERVER_ADDRESS}/ws?clientId={client_id}")
-            get_images(ws, workflow_data, job_id,
-                       workflow_filename.replace(".json", ""), client_id)
-        finally:
-            ws.close()
-
-       # ✅ Mark as completed in DB
-        workflow_key = f"workflow_pg{page_num}"
-        update_result = user_details_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {f"workflows.{workflow_key}.status": "completed"}}
-        )
-        
-        logger.info(f"✅ Updated workflow status for {workflow_key} in DB")
-        
-        # Only check for preview completion if this is a preview workflow
-        if is_preview_workflow:
-            # Get the current state of all workflows
-            user = user_details_collection.find_one({"job_id": job_id})
-            if not user:
-                logger.error(f"❌ User record not found for job_id={job_id}")
-                return
-
-            workflows = user.get("workflows", {})
-            logger.info(f"📊 Current workflows status: {workflows}")
-
-            # Check if all first 10 workflows are completed AND email hasn't been sent
-            all_preview_completed = True
-            for i in range(10):  # Check pg0 to pg9
-                workflow_key = f"workflow_pg{i}"
-                if workflows.get(workflow_key, {}).get("status") != "completed":
-                    all_preview_completed = False
-                    logger.info(f"⏳ Workflow {workflow_key} not completed yet")
-                    break
-
-            if all_preview_completed and not user.get("preview_email_sent", False):
-                logger.info("🎉 All 10 preview workflows completed!")
-                
-                preview_url = user.get("preview_url", "")
-                email = user.get("email")
-                
-                if not email:
-                    logger.error("❌ No email found in user record")
-                    return
-                    
-                if not preview_url:
-                    logger.error("❌ No preview_url found in user record")
-                    return
-                    
-                try:
-                    logger.info(f"📧 Preparing to send preview email to {email}")
-                    preview_email_lock(
-                        name=user.get("name", ""),
-                        email=email,
-                        preview_url=preview_url
-                    )
-                    logger.info("✅ Preview email sent successfully")
-                    
-                    # Mark that email was sent to prevent duplicates
-                    user_details_collection.update_one(
-                        {"job_id": job_id},
-                        {
-                            "$set": {
-                                "preview_email_sent": True,
-                                "preview_email_sent_at": datetime.utcnow()
-                            }
-                        }
-                    )
-                    
-                except Exception as e:
-                    logger.error(f"❌ Failed to send preview email: {str(e)}")
-                    raise
-            elif all_preview_completed:
-                logger.info("ℹ️ All preview workflows completed but email already sent")
-            else:
-                logger.info("🔄 Not all preview workflows completed yet")
-        else:
-            logger.info(f"ℹ️ Workflow pg{page_num} completed (not a preview workflow)")
-            
-    except Exception as e:
-        logger.exception(f"🔥 Workflow {workflow_filename} failed for job_id={job_id}: {e}")
-        workflow_key = f"workflow_{workflow_filename.replace('.json', '')}"
-        user_details_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {f"workflows.{workflow_key}.status": "failed"}}
-        )
-        raise HTTPException(
-            status_code=500, detail=f"Workflow {workflow_filename} failed: {str(e)}")
+async def run_workflow_in_background_lock(
+    job_id: str,
+    name: str,
+    gender: str,
+    saved_filenames: List[str],
+    book_id: str,
+    workflow_filename: str,
+    server_address: Optional[str] = None
+):
+    await run_story_page_workflow(
+        job_id, name, gender, saved_filenames, book_id, workflow_filename,
+        lock=True, server_address=server_address)
 
 @app.get("/get-country")
 def get_country(request: Request):
@@ -1878,13 +1620,13 @@ async def update_country(data: dict):
     if locale == "UK":
         locale = "GB"
 
-    job = user_details_collection.find_one({"job_id": job_id})
+    job = await user_details_repo.get(job_id, {"locale": 1})
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
     if not job.get("locale") or job["locale"] == "":
-        user_details_collection.update_one(
-            {"job_id": job_id},
+        await user_details_repo.update(
+            job_id,
             {"$set": {"locale": locale}}
         )
         print(f"✅ Saved locale={locale} for job_id={job_id}")
@@ -1893,6 +1635,16 @@ async def update_country(data: dict):
 
     return {"status": "ok"}
 
+def story_page_payload(name: str, gender: str, saved_filenames: List[str],
+                       book_id: str, workflow_filename: str) -> dict:
+    return {
+        "name": name,
+        "gender": gender,
+        "saved_filenames": saved_filenames,
+        "book_id": book_id,
+        "workflow_filename": workflow_filename,
+    }
+
 def execute_remaining_workflows(job_id: str, start_from_pg: int = 10):
     user = user_details_collection.find_one({"job_id": job_id})
     if not user:
@@ -1913,31 +1665,36 @@ def execute_remaining_workflows(job_id: str, start_from_pg: int = 10):
             logger.error(f"❌ No input images found for job_id: {job_id}")
             return
 
-    total = user.get("total_workflows", 20)
+    total = user.get("total_workflows") or story_catalog.total_workflows(book_id, gender) or 20
+
+    # 💳 Paid order: anything of theirs still waiting moves ahead of free previews
+    gpu_scheduler.promote(job_id, PRIORITY_PAID)
 
+    pages = []
     for page_index in range(start_from_pg, total):
         workflow_filename = f"{page_index:02d}_{book_id}_{gender}.json"
-        logger.info(f"⚙️ Starting pg{page_index} -> {workflow_filename}")
+        logger.info(f"⚙️ Queueing pg{page_index} -> {workflow_filename}")
+        pages.append((
+            story_page_payload(name, gender, saved_filenames, book_id, workflow_filename),
+            f"workflow_pg{page_index}"
+        ))
+    if not pages:
+        return
 
-        try:
-            run_workflow_in_background_lock(
-                job_id, name, gender, saved_filenames, book_id, workflow_filename
-            )
-        except Exception as e:
-            logger.exception(f"❌ Failed to start workflow {workflow_filename}: {e}")
+    # One write marks every remaining page processing, one bulk write queues them
+    user_details_collection.update_one(
+        {"job_id": job_id},
+        {"$set": {f"workflows.{workflow_key}.status": "processing" for _, workflow_key in pages},
+         "$inc": {"version": 1}}
+    )
+    gpu_scheduler.submit_many("story_page_lock", job_id, pages, priority=PRIORITY_PAID)
 
 async def run_remaining_workflows_async(job_id: str, start_from_pg: int = 10):
-    loop = asyncio.get_event_loop()
     try:
-        await loop.run_in_executor(
-            executor,
-            execute_remaining_workflows,
-            job_id,
-            start_from_pg 
-        )
-        logger.info(f"✅ Background processing completed for {job_id}")
+        await asyncio.to_thread(execute_remaining_workflows, job_id, start_from_pg)
+        logger.info(f"✅ Remaining workflows queued for {job_id}")
     except Exception as e:
-        logger.error(f"❌ Background processing failed for {job_id}: {e}")
+        logger.error(f"❌ Failed to queue remaining workflows for {job_id}: {e}")
 
 @app.post("/execute-workflow")
 async def execute_workflow(
@@ -1956,11 +1713,11 @@ async def execute_workflow(
     book_id = (book_id or "story1").lower()
 
     try:
-        user_details = user_details_collection.find_one({"job_id": job_id})
+        user_details = await user_details_repo.get(job_id)
         if not user_details:
             logger.info(
                 "👤 No user record found for job_id=%s. Creating new entry.", job_id)
-            user_details_collection.insert_one({
+            await user_details_repo.insert({
                 "job_id": job_id,
                 "name": name,
                 "gender": gender,
@@ -1972,6 +1729,7 @@ async def execute_workflow(
                 "paid": False,
                 "approved": False,
                 "workflows": {},
+                "image_manifest": {},
                 "created_at": datetime.now(timezone.utc),
                 "updated_at": datetime.now(timezone.utc),
             })
@@ -1984,29 +1742,24 @@ async def execute_workflow(
             raise HTTPException(
                 status_code=400, detail="Uploaded images not found.")
 
-        user_details_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {"workflows": {}}}
-        )
-
         workflow_files = get_sorted_workflow_files(book_id, gender)
 
         if not workflow_files:
+            await user_details_repo.update(
+                job_id,
+                {"$set": {"workflows": {}}, "$inc": {"version": 1}}
+            )
             raise HTTPException(
                 status_code=404, detail="No valid story workflow files found.")
 
-        for page_num, file_name in workflow_files:
-            workflow_key = f"workflow_pg{page_num}"
-            user_details_collection.update_one(
-                {"job_id": job_id},
-                {"$set": {f"workflows.{workflow_key}.status": "processing"}}
-            )
-
-            background_tasks.add_task(
-                run_workflow_in_background,
-                job_id, name, gender, saved_filenames,
-                 book_id, file_name
-            )
+        # Reset + mark every page processing in one write, then queue them in one bulk write
+        pages = [
+            (story_page_payload(name, gender, saved_filenames, book_id, file_name),
+             f"workflow_pg{page_num}")
+            for page_num, file_name in workflow_files
+        ]
+        await user_details_repo.start_workflows(job_id, [key for _, key in pages])
+        await asyncio.to_thread(gpu_scheduler.submit_many, "story_page", job_id, pages)
 
         return {
             "status": "processing",
@@ -2036,10 +1789,10 @@ async def execute_workflow_lock(
 
     try:
         # Step 1: Ensure user record exists
-        user_details = user_details_collection.find_one({"job_id": job_id})
+        user_details = await user_details_repo.get(job_id)
         if not user_details:
             logger.info("👤 No user found for job_id=%s. Creating entry.", job_id)
-            user_details_collection.insert_one({
+            await user_details_repo.insert({
                 "job_id": job_id,
                 "name": name,
                 "gender": gender,
@@ -2052,6 +1805,7 @@ async def execute_workflow_lock(
                 "approved": False,
                 "print_approval": False,
                 "workflows": {},
+                "image_manifest": {},
                 "created_at": datetime.now(timezone.utc),
                 "updated_at": datetime.now(timezone.utc),
             })
@@ -2066,45 +1820,35 @@ async def execute_workflow_lock(
             raise HTTPException(
                 status_code=400, detail="Uploaded images not found.")
 
-        # Step 3: Reset workflows before starting
-        user_details_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {"workflows": {}}}
-        )
-
-        # Step 4: Load and sort story workflows (pgX)
+        # Step 3: Load and sort story workflows (pgX)
         all_workflows = get_sorted_workflow_files(book_id, gender)
-        total_workflows = len(all_workflows)
+        total_workflows = story_catalog.total_workflows(book_id, gender)
         workflows_to_run = all_workflows[:10]
 
         if not workflows_to_run:
             logger.error("❌ No valid story workflow files found in pg0–pg9.")
+            await user_details_repo.update(
+                job_id,
+                {"$set": {"workflows": {}}, "$inc": {"version": 1}}
+            )
             raise HTTPException(
                 status_code=404, detail="No valid story workflow files found.")
 
-        # Step 5: Save total_workflows to DB for frontend lock logic
-        user_details_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {
-                "total_workflows": total_workflows,
-            }}
-        )
-
         logger.info("🔢 Found %d total workflows, executing first 10...", total_workflows)
 
-        # Step 6: Launch each workflow (pg0–pg9)
-        for page_num, file_name in workflows_to_run:
-            workflow_key = f"workflow_pg{page_num}"
-            user_details_collection.update_one(
-                {"job_id": job_id},
-                {"$set": {f"workflows.{workflow_key}.status": "processing"}}
-            )
+        # Step 4: Reset workflows, mark pg0–pg9 processing and save total_workflows
+        # (for the frontend lock logic) in one write
+        pages = [
+            (story_page_payload(name, gender, saved_filenames, book_id, file_name),
+             f"workflow_pg{page_num}")
+            for page_num, file_name in workflows_to_run
+        ]
+        await user_details_repo.start_workflows(
+            job_id, [key for _, key in pages], {"total_workflows": total_workflows})
 
-            background_tasks.add_task(
-                run_workflow_in_background_lock,
-                job_id, name, gender, saved_filenames, book_id, file_name
-            )
-            logger.info("🚀 Launched workflow_pg%d for job_id=%s", page_num, job_id)
+        # Step 5: Queue every page in one bulk write
+        await asyncio.to_thread(gpu_scheduler.submit_many, "story_page_lock", job_id, pages)
+        logger.info("🚀 Queued %d workflow(s) for job_id=%s", len(pages), job_id)
 
         return {
             "status": "processing",
@@ -2142,7 +1886,7 @@ def regenerate_workflow(
 
         user_details_collection.update_one(
             {"job_id": job_id},
-            {"$set": {f"workflows.workflow_{workflow_number}.status": "processing"}}
+            {"$set": {f"workflows.workflow_{workflow_number}.status": "processing"}, "$inc": {"version": 1}}
         )
 
         workflow_filename = ""
@@ -2151,16 +1895,12 @@ def regenerate_workflow(
         else:
             workflow_filename = f"{workflow_number}.json"
 
-        if job_type.lower() == "comic":
-            thread = LoggedThread(target=run_workflow_in_background, args=(
-                job_id, name, gender, saved_filenames, book_id, workflow_filename
-            ))
-            thread.start()
-        else:
-            background_tasks.add_task(
-                run_workflow_in_background,
-                job_id, name, gender, saved_filenames, book_id, workflow_filename
-            )
+        gpu_scheduler.submit(
+            "story_page", job_id,
+            story_page_payload(name, gender, saved_filenames, book_id, workflow_filename),
+            priority=PRIORITY_REGENERATE,
+            workflow_key=f"workflow_{workflow_number}"
+        )
 
         return {"status": "regenerating", "workflow": workflow_number}
 
@@ -2188,14 +1928,16 @@ def regenerate_workflow_lock(
 
         user_details_collection.update_one(
             {"job_id": job_id},
-            {"$set": {f"workflows.workflow_{workflow_number}.status": "processing"}}
+            {"$set": {f"workflows.workflow_{workflow_number}.status": "processing"}, "$inc": {"version": 1}}
         )
 
         workflow_filename = f"{workflow_number}.json"
 
-        background_tasks.add_task(
-            run_workflow_in_background_lock,
-            job_id, name, gender, saved_filenames, book_id, workflow_filename
+        gpu_scheduler.submit(
+            "story_page_lock", job_id,
+            story_page_payload(name, gender, saved_filenames, book_id, workflow_filename),
+            priority=PRIORITY_REGENERATE,
+            workflow_key=f"workflow_{workflow_number}"
         )
 
         return {"status": "regenerating", "workflow": workflow_number}
@@ -2204,13 +1946,41 @@ def regenerate_workflow_lock(
         logger.exception("🔥 Error during workflow regeneration")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def load_polled_job(job_id, if_none_match, wait=0.0):
+    """Fetch a job for a poll. Returns (user_details, etag); user_details is None when
+    the client's copy is still current, etag is None for legacy jobs listed from S3."""
+    # the version alone decides whether the full document is needed at all
+    state = await user_details_repo.get_poll_state(job_id)
+    if not state:
+        return None, None
+    if not state.get("has_manifest"):
+        return await user_details_repo.get(job_id), None
+
+    version = state.get("version", 0)
+    if etag_matches(if_none_match, version_etag(job_id, version)):
+        if wait <= 0:
+            return None, version_etag(job_id, version)
+        # job events wake the waiter; the version is re-read only then (or on the fallback tick)
+        async with job_events.subscribe(job_id) as wakeups:
+            new_version = await wait_for_version_change(
+                lambda: user_details_repo.get_version(job_id), version, wait, wakeups)
+        if new_version == version:
+            return None, version_etag(job_id, version)
+
+    user_details = await user_details_repo.get(job_id)
+    if not user_details:
+        return None, None
+    return user_details, version_etag(job_id, user_details.get("version", 0))
+
 @app.get("/poll-images")
-async def poll_images(job_id: str = Query(...)):
+async def poll_images(request: Request, response: Response, job_id: str = Query(...),
+                      wait: float = Query(0)):
     # logger.info("🔍 Handling /poll-images request for job_id=%s", job_id)
-    workflow_groups = {}
-
     try:
-        user_details = user_details_collection.find_one({"job_id": job_id})
+        user_details, etag = await load_polled_job(
+            job_id, request.headers.get("if-none-match"), wait)
+        if etag and user_details is None:
+            return not_modified(etag)
         if not user_details:
             raise HTTPException(
                 status_code=404, detail="User not found for job ID.")
@@ -2225,42 +1995,7 @@ async def poll_images(job_id: str = Query(...)):
 
         # logger.debug(f"🧠 Expecting workflows: {expected_suffixes}")
 
-        response = s3.list_objects_v2(
-            Bucket=S3_DIFFRUN_GENERATIONS, Prefix=f"{S3_JPG_PREFIX}/{job_id}_")
-        s3_files = response.get("Contents", [])
-
-        for obj in s3_files:
-            key = obj["Key"]
-            file = os.path.basename(key)
-
-            if (
-                not file.startswith(job_id)
-                or not file.lower().endswith(".jpg")
-                or "collage" in file.lower()
-            ):
-                continue
-
-            match = re.match(
-                rf"{re.escape(job_id)}_(pg\d+|\d+)_\d+_\d+\.jpg", file)
-            if not match:
-                # logger.debug("⚠️ Skipping unmatched filename: %s", file)
-                continue
-
-            workflow_id = match.group(1)
-            if workflow_id not in expected_suffixes:
-                logger.debug(
-                    "🛑 Skipping non-expected workflow ID: %s", workflow_id)
-                continue
-
-            try:
-                image_url = f"https://{S3_DIFFRUN_GENERATIONS}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{key}"
-                workflow_groups.setdefault(workflow_id, []).append({
-                    "filename": file,
-                    "url": image_url
-                })
-            except Exception as e:
-                logger.warning(
-                    "❌ Could not construct image URL for file %s: %s", file, str(e))
+        workflow_groups = await asyncio.to_thread(list_job_images, job_id, user_details)
 
         carousels = []
         for workflow_id in sorted(expected_suffixes, key=lambda x: int(re.sub(r"\D", "", x))):
@@ -2275,11 +2010,16 @@ async def poll_images(job_id: str = Query(...)):
         if completed:
             current_status = user_details.get("workflow_status", "")
             if current_status != "completed":
-                user_details_collection.update_one(
-                    {"job_id": job_id},
+                await user_details_repo.update(
+                    job_id,
                     {"$set": {"workflow_status": "completed",
-                              "updated_at": datetime.now(timezone.utc)}}
+                              "updated_at": datetime.now(timezone.utc)},
+                     "$inc": {"version": 1}}
                 )
+                if etag:
+                    # this write bumped the version; hand out the tag for the new one. If
+                    # another write raced in, the real version is higher and simply won't match
+                    etag = version_etag(job_id, user_details.get("version", 0) + 1)
                 logger.info(
                     "🎉 Workflow marked as COMPLETED for job_id=%s", job_id)
                                 # ✅ Attempt to send preview email
@@ -2294,6 +2034,8 @@ async def poll_images(job_id: str = Query(...)):
                     except Exception as e:
                         logger.exception(f"📨 Failed to send preview email for job_id={job_id}")
 
+        if etag:
+            set_etag(response, etag)
         return {
             "carousels": carousels,
             "completed": completed
@@ -2305,11 +2047,13 @@ async def poll_images(job_id: str = Query(...)):
             status_code=500, detail=f"An error occurred: {str(e)}")
 
 @app.get("/poll-images-lock")
-async def poll_images_lock(job_id: str = Query(...)):
-    workflow_groups = {}
-
+async def poll_images_lock(request: Request, response: Response, job_id: str = Query(...),
+                           wait: float = Query(0)):
     try:
-        user_details = user_details_collection.find_one({"job_id": job_id})
+        user_details, etag = await load_polled_job(
+            job_id, request.headers.get("if-none-match"), wait)
+        if etag and user_details is None:
+            return not_modified(etag)
         if not user_details:
             raise HTTPException(status_code=404, detail="User not found for job ID.")
 
@@ -2317,43 +2061,8 @@ async def poll_images_lock(job_id: str = Query(...)):
         expected_suffixes = [f"pg{i}" for i in range(total)]
         logger.debug(f"🧠 Expecting workflows: {expected_suffixes}")
 
-        response = s3.list_objects_v2(
-            Bucket=S3_DIFFRUN_GENERATIONS,
-            Prefix=f"{S3_JPG_PREFIX}/{job_id}_"
-        )
-        s3_files = response.get("Contents", [])
-
-        for obj in s3_files:
-            key = obj["Key"]
-            file = os.path.basename(key)
-
-            if (
-                not file.startswith(job_id)
-                or not file.lower().endswith(".jpg")
-                or "collage" in file.lower()
-            ):
-                continue
-
-            match = re.match(rf"{re.escape(job_id)}_(pg\d+|\d+)_\d+_\d+\.jpg", file)
-            if not match:
-                logger.debug("⚠️ Skipping unmatched filename: %s", file)
-                continue
-
-            workflow_id = match.group(1)
-            normalized_workflow_id = f"pg{int(re.sub(r'\D', '', workflow_id))}"
-
-            if normalized_workflow_id not in expected_suffixes:
-                logger.debug("🛑 Skipping non-expected workflow ID: %s", normalized_workflow_id)
-                continue
-
-            try:
-                image_url = f"https://{S3_DIFFRUN_GENERATIONS}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{key}"
-                workflow_groups.setdefault(normalized_workflow_id, []).append({
-                    "filename": file,
-                    "url": image_url
-                })
-            except Exception as e:
-                logger.warning("❌ Could not construct image URL for file %s: %s", file, str(e))
+        workflow_groups = await asyncio.to_thread(
+            list_job_images, job_id, user_details, normalize=True)
 
         carousels = []
         for workflow_id in sorted(expected_suffixes, key=lambda x: int(re.sub(r"\D", "", x))):
@@ -2365,6 +2074,8 @@ async def poll_images_lock(job_id: str = Query(...)):
 
         completed = all(len(c["images"]) > 0 for c in carousels)
 
+        if etag:
+            set_etag(response, etag)
         return {
             "carousels": carousels,
             "completed": completed,
@@ -2377,98 +2088,103 @@ async def poll_images_lock(job_id: str = Query(...)):
         logger.exception("❌ Error while polling images for job_id=%s", job_id)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-def run_coverpage_workflow_in_background(
+@app.get("/job-events/{job_id}")
+async def job_events_stream(job_id: str, request: Request):
+    # Server-sent events for one job: a snapshot, then each workflow_pgN as it finishes
+    user_details = await user_details_repo.get(
+        job_id, {"workflows": 1, "image_manifest": 1, "workflow_status": 1})
+    if not user_details:
+        raise HTTPException(status_code=404, detail="User not found for job ID.")
+
+    snapshot = {
+        "workflow_status": user_details.get("workflow_status"),
+        "workflows": {
+            key.replace("workflow_", ""): value.get("status")
+            for key, value in user_details.get("workflows", {}).items()
+            if isinstance(value, dict)
+        },
+        "images": {
+            workflow_id: [image["url"] for image in images]
+            for workflow_id, images in (user_details.get("image_manifest") or {}).items()
+        },
+    }
+
+    return StreamingResponse(
+        job_events.stream(job_id, snapshot, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def find_cover_inputs(job_id: str, cover_input_filename: str):
+    user_images = sorted([
+        f for f in os.listdir(INPUT_FOLDER)
+        if f.startswith(job_id) and f.lower().endswith(".jpg")
+    ])
+    if not user_images:
+        raise HTTPException(
+            status_code=400, detail="User images not found")
+
+    cover_path = Path(INPUT_FOLDER) / "cover_inputs" / \
+        job_id / cover_input_filename
+    if not cover_path.exists():
+        raise FileNotFoundError(
+            f"No matching cover image found at: {cover_path}")
+    return user_images, cover_path
+
+async def run_coverpage_workflow_in_background(
     job_id: str,
     book_id: str,
     book_style: str,
-    cover_input_filename: str
+    cover_input_filename: str,
+    server_address: Optional[str] = None
 ):
     try:
         logger.info("🚀 Running coverpage workflow for job_id=%s", job_id)
 
-        workflow_filename = f"{book_style}_{book_id}.json"
-        workflow_path = os.path.join(
-            INPUT_FOLDER, "stories", "coverpage_wide", workflow_filename)
-
-        if not os.path.exists(workflow_path):
-            raise HTTPException(
-                status_code=404, detail=f"Workflow not found: {workflow_path}")
-
-        workflow_data = load_workflow(workflow_path)
-        if isinstance(workflow_data, list):
-            workflow_data = workflow_data[0] if workflow_data else {}
+        try:
+            template = workflow_templates.coverpage(book_style, book_id)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
 
         # ✅ Fetch user's name from DB
-        user = user_details_collection.find_one({"job_id": job_id})
+        user = await user_details_repo.get(job_id, {"name": 1})
         if not user:
             raise HTTPException(
                 status_code=404, detail="User record not found")
         name = user.get("name", "").capitalize()
 
-        # ✅ Step 1: Inject user-uploaded images into nodes 91, 92, 93
-        user_images = sorted([
-            f for f in os.listdir(INPUT_FOLDER)
-            if f.startswith(job_id) and f.lower().endswith(".jpg")
-        ])
-        if not user_images:
-            raise HTTPException(
-                status_code=400, detail="User images not found")
+        # ✅ Steps 1–2: User images (nodes 91, 92, 93) and cover image (node 6), looked up off the loop
+        user_images, cover_path = await asyncio.to_thread(
+            find_cover_inputs, job_id, cover_input_filename)
 
-        for idx, node_id in enumerate(["91", "92", "93"][:len(user_images)]):
-            full_path = os.path.join(INPUT_FOLDER, user_images[idx])
-            if node_id in workflow_data and "inputs" in workflow_data[node_id]:
-                workflow_data[node_id]["inputs"]["image"] = full_path
-                logger.info(
-                    f"🖼️ Injected {user_images[idx]} into node {node_id}")
-
-        # ✅ Step 2: Inject cover image into node 6
-        cover_path = Path(INPUT_FOLDER) / "cover_inputs" / \
-            job_id / cover_input_filename
-        if not cover_path.exists():
-            raise FileNotFoundError(
-                f"No matching cover image found at: {cover_path}")
-
-        if "6" in workflow_data and "inputs" in workflow_data["6"]:
-            workflow_data["6"]["inputs"]["image"] = str(cover_path)
-            logger.info("🧾 Injected cover image into node 6")
-
-        # ✅ Step 3: Inject child name into node 95
-        if "95" in workflow_data and "inputs" in workflow_data["95"]:
-            workflow_data["95"]["inputs"]["value"] = name
-            logger.info(f"📝 Injected name '{name}' into node 95")
-
-        # ✅ Step 4: Inject job_id
-        known_job_id = "e44054af-f0ce-4413-8b37-853e1cc680aa"
-        job_id_node = find_job_id_node(workflow_data, known_job_id)
-        if job_id_node and "inputs" in workflow_data[job_id_node]:
-            workflow_data[job_id_node]["inputs"]["strings"] = job_id
-            logger.info(f"🆔 Replaced job_id in node {job_id_node}")
-
-        # ✅ Step 5: Execute via WebSocket
-        client_id = f"{job_id}_coverpage_{workflow_filename.replace('.json', '')}"
-        ws = websocket.WebSocket()
-        try:
-            ws.connect(f"ws://{SERVER_ADDRESS}/ws?clientId={client_id}")
-            get_images(ws, workflow_data, job_id, "coverpage", client_id)
-        finally:
-            ws.close()
+        # ✅ Step 3–4: Child name (node 95) and job_id, on a patched template copy
+        workflow_data = template.render(
+            job_id=job_id,
+            name=name,
+            images=[os.path.join(INPUT_FOLDER, f) for f in user_images],
+            cover_image=str(cover_path),
+        )
+
+        # ✅ Step 5: Execute via the shared ComfyUI WebSocket session
+        await get_images(workflow_data, job_id, "coverpage", server_address)
 
         logger.info(f"✅ Coverpage workflow completed for job_id={job_id}")
 
         # ✅ Generate cover PDF
-        pdf_path = create_front_cover_pdf(job_id, book_style, book_id)
+        pdf_path = await asyncio.to_thread(
+            create_front_cover_pdf, job_id, book_style, book_id)
         logger.info(f"📄 Cover PDF generated: {pdf_path}")
 
         try:
             s3_key = f"{APPROVED_OUTPUT_PREFIX}/{job_id}_coverpage.pdf"
-            s3.upload_file(pdf_path, APPROVED_OUTPUT_BUCKET, s3_key)
-            logger.info(
-                f"📤 Uploaded cover PDF to S3: s3://{APPROVED_OUTPUT_BUCKET}/{s3_key}")
+            await s3_uploader.upload_file_async(
+                pdf_path, APPROVED_OUTPUT_BUCKET, s3_key, content_type="application/pdf")
             cover_url = f"https://{APPROVED_OUTPUT_BUCKET}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_key}"
 
-            user_details_collection.update_one(
-                {"job_id": job_id},
+            await user_details_repo.update(
+                job_id,
                 {"$set": {"cover_url": cover_url,
+                          "cover_status": "completed",
                           "updated_at": datetime.now(timezone.utc)}}
             )
         except Exception as e:
@@ -2482,6 +2198,10 @@ def run_coverpage_workflow_in_background(
         raise HTTPException(
             status_code=500, detail=f"Coverpage workflow failed: {str(e)}")
 
+gpu_scheduler.register("story_page", run_workflow_in_background)
+gpu_scheduler.register("story_page_lock", run_workflow_in_background_lock)
+gpu_scheduler.register("coverpage", run_coverpage_workflow_in_background)
+
 @app.post("/preview-email")
 async def preview_email(name: str, email: str, preview_url: str):
     try:
@@ -2535,9 +2255,7 @@ async def preview_email(name: str, email: str, preview_url: str):
         msg.set_content("This email contains HTML content.")
         msg.add_alternative(html_content, subtype="html")
 
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_USER, EMAIL_PASS)
-            smtp.send_message(msg)
+        await email_service.send_async(msg)
 
         return {"status": "success", "message": f"Email sent to {email}"}
 
@@ -2597,9 +2315,8 @@ def preview_email_lock(name: str, email: str, preview_url: str):
         msg.set_content("This email contains HTML content.")
         msg.add_alternative(html_content, subtype="html")
 
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_USER, EMAIL_PASS)
-            smtp.send_message(msg)
+        # callers run this in a thread and need to know whether it was delivered
+        email_service.send_and_wait(msg)
 
         return {"status": "success", "message": f"Email sent to {email}"}
 
@@ -2662,9 +2379,7 @@ def preview_email(name: str, email: str, preview_url: str):
         msg.set_content("This email contains HTML content.")
         msg.add_alternative(html_content, subtype="html")
 
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_USER, EMAIL_PASS)
-            smtp.send_message(msg)
+        email_service.send(msg)
 
         return {"status": "success", "message": f"Email sent to {email}"}
 
@@ -2763,11 +2478,10 @@ async def payment_done_email(username: str, child_name: str, email: str, preview
         msg.set_content("This email contains HTML content.")
         msg.add_alternative(html_content, subtype="html")
 
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_USER, EMAIL_PASS)
-            smtp.send_message(msg)
+        # queued, not awaited: the payment response must not wait on SMTP
+        email_service.send(msg)
 
-        logger.info(f"📧 Order confirmation email sent to {email}")
+        logger.info(f"📧 Order confirmation email queued for {email}")
     except Exception as e:
         logger.error(f"❌ Failed to send order confirmation email: {e}")
 
@@ -2867,11 +2581,10 @@ async def payment_done_email_lock(username: str, child_name: str, email: str, pr
         msg.set_content("This email contains HTML content.")
         msg.add_alternative(html_content, subtype="html")
 
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_USER, EMAIL_PASS)
-            smtp.send_message(msg)
+        # queued, not awaited: the payment response must not wait on SMTP
+        email_service.send(msg)
 
-        logger.info(f"📧 Order confirmation email sent to {email}")
+        logger.info(f"📧 Order confirmation email queued for {email}")
     except Exception as e:
         logger.error(f"❌ Failed to send order confirmation email: {e}")
 
@@ -2903,11 +2616,9 @@ def approval_confirmation_email(username: str, child_name: str, email: str):
         msg.set_content("This email contains HTML content.")
         msg.add_alternative(html_content, subtype="html")
 
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_USER, EMAIL_PASS)
-            smtp.send_message(msg)
+        email_service.send(msg)
 
-        logger.info(f"📦 Delivery confirmation email sent to {email}")
+        logger.info(f"📦 Delivery confirmation email queued for {email}")
 
     except Exception as e:
         logger.error(f"❌ Failed to send delivery email: {e}")
@@ -2921,8 +2632,8 @@ async def update_print_approval(request: Request):
         if not job_id:
             raise HTTPException(status_code=400, detail="Job ID is required")
        
-        result = user_details_collection.update_one(
-            {"job_id": job_id},
+        result = await user_details_repo.update(
+            job_id,
             {"$set": {"print_approval": True}}
         )
         
@@ -2938,66 +2649,66 @@ async def update_print_approval(request: Request):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/about")
-async def serve_about():
-    return FileResponse("frontend/out/about.html")
+async def serve_about(request: Request):
+    return html_shells.page("about.html", request)
 
 @app.get("/books")
-async def serve_about():
-    return FileResponse("frontend/out/books.html")
+async def serve_about(request: Request):
+    return html_shells.page("books.html", request)
 
 @app.get("/child-details")
-async def serve_child_details():
-    return FileResponse("frontend/out/child-details.html")
+async def serve_child_details(request: Request):
+    return html_shells.page("child-details.html", request)
 
 @app.get("/contact")
-async def serve_contact():
-    return FileResponse("frontend/out/contact.html")
+async def serve_contact(request: Request):
+    return html_shells.page("contact.html", request)
 
 @app.get("/checkout")
-async def serve_contact():
-    return FileResponse("frontend/out/checkout.html")
+async def serve_contact(request: Request):
+    return html_shells.page("checkout.html", request)
 
 @app.get("/confirmation")
-async def serve_contact():
-    return FileResponse("frontend/out/confirmation.html")
+async def serve_contact(request: Request):
+    return html_shells.page("confirmation.html", request)
 
 @app.get("/preview")
-async def serve_preview():
-    return FileResponse("frontend/out/preview.html")
+async def serve_preview(request: Request):
+    return html_shells.page("preview.html", request)
 
 @app.get("/purchase")
-async def serve_purchase():
-    return FileResponse("frontend/out/purchase.html")
+async def serve_purchase(request: Request):
+    return html_shells.page("purchase.html", request)
 
 @app.get("/user-details")
-async def serve_user_details():
-    return FileResponse("frontend/out/user-details.html")
+async def serve_user_details(request: Request):
+    return html_shells.page("user-details.html", request)
 
 @app.get("/faq")
-async def serve_user_details():
-    return FileResponse("frontend/out/faq.html")
+async def serve_user_details(request: Request):
+    return html_shells.page("faq.html", request)
 
 @app.get("/email-preview-request")
-async def serve_email_preview_request():
-    return FileResponse("frontend/out/email-preview-request.html")
+async def serve_email_preview_request(request: Request):
+    return html_shells.page("email-preview-request.html", request)
 
 @app.get("/thankyou")
-def thankyou():
-    return FileResponse("frontend/out/thankyou.html")
+def thankyou(request: Request):
+    return html_shells.page("thankyou.html", request)
 
 @app.get("/approved")
-async def serve_about():
-    return FileResponse("frontend/out/approved.html")
+async def serve_about(request: Request):
+    return html_shells.page("approved.html", request)
 
 @app.get("/after-payment")
-async def after_payment():
-    return FileResponse("frontend/out/after-payment.html")
+async def after_payment(request: Request):
+    return html_shells.page("after-payment.html", request)
 
 @app.get("/healthcheck")
 def healthcheck():
     return {"status": "ok"}
 
-app.mount("/", StaticFiles(directory="frontend/out", html=True), name="static")
+app.mount("/", CachedStaticFiles(directory="frontend/out", html=True), name="static")
 
 if __name__ == '__main__':
     import uvicorn
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.results import InsertOneResult, UpdateResult
+
+from database import DB_NAME, MONGO_URI
+
+# One shared async client for the request path; the sync client in database.py
+# stays for worker threads and startup tasks
+async_client = AsyncMongoClient(MONGO_URI)
+async_db = async_client[DB_NAME]
+
+
+class UserDetailsRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, job_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"job_id": job_id}, projection)
+
+    async def get_by_order_id(self, order_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"order_id": order_id}, projection)
+
+    async def exists(self, job_id: str) -> bool:
+        return await self.collection.find_one({"job_id": job_id}, {"_id": 1}) is not None
+
+    async def get_version(self, job_id: str) -> Optional[int]:
+        doc = await self.collection.find_one({"job_id": job_id}, {"version": 1})
+        return doc.get("version", 0) if doc else None
+
+    async def get_poll_state(self, job_id: str) -> Optional[dict]:
+        """Version and whether the job has an image manifest, without loading the document."""
+        return await self.collection.find_one(
+            {"job_id": job_id},
+            {"_id": 0, "version": 1,
+             "has_manifest": {"$ne": [{"$type": "$image_manifest"}, "missing"]}})
+
+    async def update(self, job_id: str, update: dict, upsert: bool = False) -> UpdateResult:
+        return await self.collection.update_one({"job_id": job_id}, update, upsert=upsert)
+
+    async def start_workflows(self, job_id: str, workflow_keys: list[str],
+                              extra_fields: Optional[dict] = None) -> UpdateResult:
+        """Reset the job's workflows map to these keys, all processing, in one write."""
+        fields = {
+            "workflows": {key: {"status": "processing"} for key in workflow_keys},
+            **(extra_fields or {}),
+        }
+        return await self.update(job_id, {"$set": fields, "$inc": {"version": 1}})
+
+    async def complete_workflow(self, job_id: str, workflow_key: str) -> UpdateResult:
+        return await self.update(
+            job_id,
+            {"$set": {f"workflows.{workflow_key}.status": "completed"}, "$inc": {"version": 1}}
+        )
+
+    async def claim_preview_ready(self, job_id: str, workflow_keys: list[str],
+                                  projection: Optional[dict] = None) -> Optional[dict]:
+        """Flip preview_email_sent once every preview workflow is completed.
+
+        The filter only matches while the flag is unset, so among concurrent page
+        completions exactly one caller gets the document back and sends the email.
+        """
+        query = {"job_id": job_id, "preview_email_sent": {"$ne": True}}
+        query.update({f"workflows.{key}.status": "completed" for key in workflow_keys})
+        return await self.collection.find_one_and_update(
+            query,
+            {"$set": {"preview_email_sent": True,
+                      "preview_email_sent_at": datetime.now(timezone.utc)}},
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def release_preview_claim(self, job_id: str) -> UpdateResult:
+        """Undo claim_preview_ready after a failed send so a later completion can retry."""
+        return await self.update(
+            job_id,
+            {"$set": {"preview_email_sent": False}, "$unset": {"preview_email_sent_at": ""}}
+        )
+
+    async def insert(self, document: dict) -> InsertOneResult:
+        return await self.collection.insert_one(document)
+
+    async def save(self, data: dict) -> UpdateResult:
+        try:
+            fields = dict(data)
+            # created_at is written only when this call creates the document
+            created_at = fields.pop("created_at", None) or datetime.now(timezone.utc)
+            fields["updated_at"] = datetime.now(timezone.utc)
+
+            # One atomic upsert touching only the supplied fields, so concurrent
+            # workflow/image writes to the same job are never overwritten
+            result = await self.update(
+                fields["job_id"],
+                {"$set": fields, "$setOnInsert": {"created_at": created_at}},
+                upsert=True
+            )
+
+            action = "Created" if result.upserted_id is not None else "Updated"
+            print(f"✅ {action} user details for job_id: {fields['job_id']}")
+            return result
+        except Exception as e:
+            print(f"❌ Failed to save user details: {e}")
+            raise ValueError("Failed to save user details to the database.")
+
+
+user_details_repo = UserDetailsRepository(async_db["user_details"])
+
+
+async def close_async_client():
+    await async_client.close()